@@ -1,16 +1,19 @@
 import streamlit as st
-from google.cloud import bigquery
+import time
 import pandas as pd 
-from sql_generation import generate_sql, get_bigquery_table_schema_text
-from query_verification import verify_query
-from chart_generation import generate_chart_suggestion, generate_chart
+from sql_generation import get_bigquery_table_schema_text
 from streamlit_option_menu import option_menu
-from query_scanning import get_query_cost_estimate,bytes_to_human_readable
-import json
-from insights_generation import insights
-from query_simplifier import simplify_query
-import plotly.io as pio
-from io import BytesIO
+from query_scanning import bytes_to_human_readable, QueryBudgetExceeded
+from pipeline import QueryPipeline, STREAM_LLM_OUTPUT
+from chart_export import export_chart, EXPORT_FORMATS
+from sql_validator import get_validation_stats
+from chart_recommender import get_recommender_stats
+from rollups import get_rollup_stats
+from call_limits import get_limit_stats
+from single_flight import get_single_flight_stats
+from sql_cache import get_cache_stats as get_sql_cache_stats
+from result_cache import get_cache_stats as get_result_cache_stats
+from tracing import start_trace, get_trace_spans, start_metrics_server
 import streamlit.components.v1 as components 
 
 USER_CREDENTIALS = {
@@ -22,8 +25,6 @@ project_id = "bigquery-public-data"
 dataset_id = "san_francisco_311"
 table_name = "311_service_requests"
 
-client = bigquery.Client()
-
 
 def login_page():
     col1, col2 = st.columns([1, 1])
@@ -68,13 +69,225 @@ def logout():
     st.rerun()
 
 
-def run_query_in_bigquery(project_id, query):
-    client = bigquery.Client(project=project_id)
-    query_job = client.query(query)
-    result = query_job.result()
-    df = result.to_dataframe()
-    # df = df.dropna(inplace=True)
-    return df
+def format_age(seconds):
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m {int(seconds % 60)}s"
+    return f"{int(seconds // 3600)}h {int(seconds % 3600 // 60)}m"
+
+
+def render_chart(fig, figure_key):
+    if fig:
+        st.session_state.chart_fig = fig
+        st.subheader("Generated Chart")
+        st.plotly_chart(fig, use_container_width=True)
+
+        # Export bytes are only built when a download is clicked, then cached by figure.
+        html_col, json_col = st.columns(2)
+        with html_col:
+            st.download_button(
+                label="Download Chart",
+                data=lambda: export_chart(fig, "html", figure_key),
+                file_name="interactive_chart.html",
+                mime=EXPORT_FORMATS["html"]["mime"],
+                key="download_chart_button",
+                on_click="ignore",
+            )
+        with json_col:
+            st.download_button(
+                label="Download Chart (Plotly JSON)",
+                data=lambda: export_chart(fig, "json", figure_key),
+                file_name="chart.json",
+                mime=EXPORT_FORMATS["json"]["mime"],
+                key="download_chart_json_button",
+                on_click="ignore",
+            )
+    else:
+        st.warning("Couldn’t create a chart based on the data.")
+
+
+def show_loading_pages(slot, streaming_result):
+    # Show the first page right away, then track the remaining pages as they load.
+    first_page = streaming_result.wait_for_first_page()
+    with slot.container():
+        st.caption(f"Showing the first {first_page.num_rows} rows while the rest load...")
+        st.dataframe(first_page, use_container_width=True)
+        progress = st.progress(0.0)
+        while not streaming_result.done.wait(0.25):
+            progress.progress(streaming_result.progress(), text=f"{streaming_result.rows_loaded} rows loaded")
+    slot.empty()
+
+
+def render_results(pipeline, result):
+    if result["from_cache"]:
+        st.caption(f"Served from cache ({format_age(time.time() - result['created_at'])} old).")
+    elif result.get("shared"):
+        st.caption("Fresh result, shared with another session running the same query.")
+    elif result.get("engine") == "local":
+        st.caption("Fresh result from the local snapshot.")
+    else:
+        st.caption("Fresh result from BigQuery.")
+
+    query_result = result["result"]
+    if query_result.empty:
+        st.warning("No data found")
+        return
+    st.session_state.query_result = query_result
+    st.success("Query ran successfully! Here's your data:")
+    if result.get("truncated"):
+        st.caption(f"Showing the first {query_result.num_rows} rows; the full result is larger.")
+
+    # The Arrow table goes to the frontend as-is, without a string copy of the frame.
+    st.dataframe(query_result.table,use_container_width=True)
+
+    # Insights and chart are filled in as each one finishes.
+    insight_slot = st.container()
+    chart_slot = st.container()
+    with insight_slot:
+        st.subheader("Insights:")
+        insight_placeholder = st.empty()
+        insight_placeholder.caption("Generating insights...")
+    with chart_slot:
+        chart_placeholder = st.empty()
+        chart_placeholder.caption("Generating chart...")
+
+    if not STREAM_LLM_OUTPUT:
+        for name, output in pipeline.post_query_stages():
+            if name == "insights":
+                st.session_state.insight = output
+                insight_placeholder.write(output)
+            else:
+                chart_placeholder.empty()
+                with chart_slot:
+                    render_chart(output, pipeline.chart_export_key())
+        return
+
+    chart_future = pipeline.submit("chart", pipeline.executor)
+    chart_rendered = False
+    insight = ""
+    for chunk in pipeline.stream_insights():
+        insight += chunk
+        insight_placeholder.markdown(insight)
+        if chart_future is not None and not chart_rendered and chart_future.done():
+            chart_placeholder.empty()
+            with chart_slot:
+                render_chart(chart_future.result(), pipeline.chart_export_key())
+            chart_rendered = True
+    st.session_state.insight = insight
+    # Only an insight streamed on this rerun has a span; memoized and cached ones show no timing.
+    ttft_ms = next((span.attributes["ttft_ms"] for span in get_trace_spans() if span.name == "insights" and "ttft_ms" in span.attributes), None)
+    if ttft_ms is not None:
+        with insight_slot:
+            st.caption(f"First insight token after {ttft_ms:.0f} ms.")
+
+    if not chart_rendered:
+        fig = chart_future.result() if chart_future is not None else pipeline.get("chart")
+        chart_placeholder.empty()
+        with chart_slot:
+            render_chart(fig, pipeline.chart_export_key())
+
+
+def render_timings(spans):
+    # One row per LLM / BigQuery / chart call made while serving this rerun.
+    rows = []
+    for span in spans:
+        rows.append({
+            "stage": span.name,
+            "ms": round(span.duration_seconds * 1000),
+            "prompt tokens": span.attributes.get("prompt_tokens"),
+            "response tokens": span.attributes.get("response_tokens"),
+            "bytes processed": span.attributes.get("bytes_processed") or span.attributes.get("bytes_estimated"),
+            "slot ms": span.attributes.get("slot_ms"),
+            "cache hit": span.attributes.get("cache_hit", span.attributes.get("from_cache")),
+            "error": span.error,
+        })
+    with st.expander("Stage timings", expanded=True):
+        if rows:
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        else:
+            st.caption("No model or BigQuery calls on this run; everything came from memo or cache.")
+
+
+def sql_generator_page():
+    st.title("SQL Generator and Visualizer for BigQuery")
+    
+    if not st.session_state.logged_in:
+        st.warning("🔐 Please login to access the SQL Generator.")
+        return
+
+    # Input field for user's natural language question
+    user_query = st.text_input("Enter your question", value=st.session_state.user_query_input)
+
+    # Handle Submit button
+    if st.button("Submit Query",key="submit_query_button"):
+        if user_query.strip():
+            st.session_state.user_query_input = user_query
+            st.session_state.query_submitted = True
+            st.session_state.query_ready_to_run = False
+        else:
+            st.warning("Please enter a question before submitting.")
+    
+    
+    # Show SQL and verification if query was submitted
+    if st.session_state.query_submitted:
+        pipeline = QueryPipeline(st.session_state.pipeline_state, render=render_results)
+        pipeline.set_inputs(
+            question=st.session_state.user_query_input,
+            schema=get_bigquery_table_schema_text(),
+            project_id=project_id,
+            username=st.session_state.username,
+            run_id=st.session_state.run_id,
+        )
+
+        simplified_placeholder = st.empty()
+        on_simplified = None
+        if STREAM_LLM_OUTPUT:
+            on_simplified = lambda partial: simplified_placeholder.info(f"Interpreting your question as: {partial}")
+        st.session_state.verified_sql = pipeline.resolve_sql(on_simplified=on_simplified)
+        if not st.session_state.verified_sql:
+            st.error("Couldn't verify or improve the generated query.")
+            return
+        if pipeline.sql_from_cache():
+            st.caption("Reusing a previously verified query for this question.")
+        elif pipeline.sql_shared():
+            st.caption("Another session was asking the same question; reusing its query.")
+
+        if pipeline.get("rewrite") != st.session_state.verified_sql:
+            st.caption("This query will be answered from a pre-aggregated rollup table.")
+        estimated_bytes = pipeline.get("estimate")
+        if pipeline.get("engine") == "local":
+            st.caption("This query will run on the local snapshot; no BigQuery bytes are billed.")
+        elif estimated_bytes is not None:
+            readable = bytes_to_human_readable(estimated_bytes)
+            st.subheader("Query Resource Usage") 
+            st.markdown(f"""
+    <div style=" 
+        background-color: rgba(66, 133, 244, 0.1);
+        color: var(--text-color);
+        padding: 1rem;
+        border-left: 6px solid #4285f4;
+        border-radius: 8px;
+        font-size: 1.05rem;
+        font-weight: 500;">
+        This query will process approximately <strong>{readable}</strong> of data when run.
+    </div>
+    """,
+unsafe_allow_html=True
+)
+        # Run query button
+        if st.button("Run This Query",key="run_query_button"):
+            st.session_state.query_ready_to_run = True
+            st.session_state.run_id += 1
+
+        # Run query if approved; unchanged stages come from the pipeline memo
+        if st.session_state.query_ready_to_run:
+            loading_slot = st.empty()
+            pipeline.on_progress = lambda streaming_result: show_loading_pages(loading_slot, streaming_result)
+            try:
+                pipeline.get("render")
+            except QueryBudgetExceeded as e:
+                st.error(f"Query not run: {e}")
 
 
 def main():
@@ -85,9 +298,12 @@ def main():
     st.session_state.setdefault("sql_query", "")
     st.session_state.setdefault("verified_sql", "")
     st.session_state.setdefault("query_ready_to_run", False)
-    st.session_state.setdefault("query_result_df", None)
+    st.session_state.setdefault("query_result", None)
     st.session_state.setdefault("chart_fig", None)
-    st.session_state.setdefault("chart_html_bytes", None)
+    st.session_state.setdefault("run_id", 0)
+    st.session_state.setdefault("pipeline_state", {})
+    st.session_state.setdefault("show_timings", False)
+    start_metrics_server()
 
     with st.sidebar:
         choice = option_menu(
@@ -97,6 +313,46 @@ def main():
                 menu_icon="cast",
                 default_index=0,
             )
+        sql_cache_stats = get_sql_cache_stats()
+        if sql_cache_stats["hits"] or sql_cache_stats["misses"]:
+            st.caption(
+                f"SQL cache: {sql_cache_stats['hits']} of {sql_cache_stats['hits'] + sql_cache_stats['misses']} "
+                f"questions reused a verified query ({sql_cache_stats['entries']} cached)."
+            )
+        result_cache_stats = get_result_cache_stats()
+        if result_cache_stats["entries"]:
+            st.caption(
+                f"Result cache: {result_cache_stats['entries']} query results, "
+                f"{bytes_to_human_readable(result_cache_stats['total_bytes'])} in memory."
+            )
+        validation_stats = get_validation_stats()
+        if validation_stats["checked"]:
+            st.caption(
+                f"LLM verification skipped for {validation_stats['llm_skipped']} of "
+                f"{validation_stats['checked']} queries ({validation_stats['skip_rate']:.0%}) by the local SQL validator."
+            )
+        recommender_stats = get_recommender_stats()
+        if recommender_stats["local"] or recommender_stats["llm_fallback"]:
+            st.caption(
+                f"Chart suggestions fell back to the LLM for {recommender_stats['llm_fallback']} of "
+                f"{recommender_stats['local'] + recommender_stats['llm_fallback']} results ({recommender_stats['fallback_rate']:.0%})."
+            )
+        rollup_stats = get_rollup_stats()
+        if rollup_stats["rewritten"]:
+            st.caption(
+                f"{rollup_stats['rewritten']} of {rollup_stats['rewritten'] + rollup_stats['not_rewritable']} "
+                f"queries ({rollup_stats['hit_rate']:.0%}) were answered from rollup tables."
+            )
+        for name, limit_stats in get_limit_stats().items():
+            if limit_stats["throttles"]:
+                st.caption(
+                    f"{name}: {limit_stats['throttles']} throttled calls, {limit_stats['retries']} retries, "
+                    f"concurrency cap now {limit_stats['concurrency_limit']:g}."
+                )
+        flight_stats = get_single_flight_stats()
+        if flight_stats["followers"]:
+            st.caption(f"{flight_stats['followers']} requests reused another session's identical in-flight work.")
+        st.session_state.show_timings = st.checkbox("Show stage timings", value=st.session_state.show_timings)
 
     if choice == "Login": 
         login_page()
@@ -112,126 +368,11 @@ def main():
                 
 
     elif choice == "SQL Generator":
-        st.title("SQL Generator and Visualizer for BigQuery")
-        
-        if not st.session_state.logged_in:
-            st.warning("🔐 Please login to access the SQL Generator.")
-            return
-
-        # Input field for user's natural language question
-        user_query = st.text_input("Enter your question", value=st.session_state.user_query_input)
-
-        # Handle Submit button
-        if st.button("Submit Query",key="submit_query_button"):
-            if user_query.strip():
-                st.session_state.user_query_input = user_query
-                st.session_state.query_submitted = True
-                st.session_state.query_ready_to_run = False
-                st.session_state.query_result_df = None
-                st.session_state.chart_fig = None
-                st.session_state.chart_html_bytes = None
-
-                schema = get_bigquery_table_schema_text()
-                simplified_user_query = simplify_query(user_query, schema)
-                st.session_state.simplified_user_query = simplified_user_query
-                
-                sql_query = generate_sql(simplified_user_query)
-                st.session_state.sql_query = sql_query
+        start_trace()
+        sql_generator_page()
+        if st.session_state.show_timings:
+            render_timings(get_trace_spans())
 
-                if sql_query:
-                    correct_query = verify_query(user_query, sql_query, schema)
-                    response = json.loads(correct_query)
-                    st.session_state.verified_sql = response.get("correct_query", sql_query)
-                else:
-                    st.session_state.verified_sql = ""
-                    st.error("Couldn't verify or improve the generated query.")
-            else:
-                st.warning("Please enter a question before submitting.")
-        
-        
-        # Show SQL and verification if query was submitted
-        if st.session_state.query_submitted:
-
-            estimated_bytes = get_query_cost_estimate(st.session_state.verified_sql,project_id)
-            if estimated_bytes is not None:
-                readable = bytes_to_human_readable(estimated_bytes)
-                st.subheader("Query Resource Usage") 
-                st.markdown(f"""
-    <div style=" 
-        background-color: rgba(66, 133, 244, 0.1);
-        color: var(--text-color);
-        padding: 1rem;
-        border-left: 6px solid #4285f4;
-        border-radius: 8px;
-        font-size: 1.05rem;
-        font-weight: 500;">
-        This query will process approximately <strong>{readable}</strong> of data when run.
-    </div>
-    """,
-    unsafe_allow_html=True
-)
-            # Run query button
-            if st.button("Run This Query",key="run_query_button"):
-                st.session_state.query_ready_to_run = True
-                st.session_state.chart_fig = None
-                st.session_state.chart_html_bytes = None
-
-            # Run query if approved and no cached result
-            if st.session_state.query_ready_to_run:
-                df = run_query_in_bigquery(project_id, st.session_state.verified_sql)
-                df=df.dropna()
-                if df.empty:
-                    st.warning("No data found")
-                    return 
-                else:
-                    st.session_state.query_result_df = df.dropna()
-                    st.success("Query ran successfully! Here's your data:")
-                    print(df.head(2))
-
-                    df_display = df.copy()
-                    df_display = df_display.astype(str)
-                    # st.dataframe(df)
-                    st.dataframe(df_display,use_container_width=True)
-                    # st.table(df)
-                    # st.table(df_display)
-
-                    df_json = df.head(250).to_json(orient="records")
-                    print(df_json)
-                    insight = insights(user_query, df_json)
-                    st.session_state.insight = insight
-                    st.subheader("Insights:")
-                    st.write(insight)
-
-
-                # # Show cached results if available
-                # if st.session_state.query_result_df is not None:
-                #     st.success("Query ran successfully! Here's your data:")
-                #     st.dataframe(st.session_state.query_result_df)
-                    #df = st.session_state.query_result_df
-                    df_head = df.head(25).to_string()
-                    df_dtypes = str(df.dtypes)
-                    suggestion = generate_chart_suggestion(df_head, df_dtypes, user_query, st.session_state.get("insight", ""))
-                    df = df.dropna()
-                    fig = generate_chart(df, suggestion)
-                    if fig:
-                        fig.update_layout(template="plotly")
-                        st.session_state.chart_fig = fig
-                        st.session_state.chart_html_bytes = BytesIO(pio.to_html(fig, full_html=True, include_plotlyjs='cdn').encode("utf-8"))
-
-                    # Display chart if available
-                    if st.session_state.chart_fig:
-                        st.subheader("Generated Chart")
-                        st.plotly_chart(st.session_state.chart_fig, use_container_width=True)
-
-                        st.download_button(
-                            label="Download Chart",
-                            data=st.session_state.chart_html_bytes,
-                            file_name="interactive_chart.html",
-                            mime="text/html",
-                            key="download_chart_button"
-                        )
-                    else:
-                        st.warning("Couldn’t create a chart based on the data.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,213 @@
+"""Runs a file of questions through the SQL pipeline without the Streamlit UI.
+
+    python batch_runner.py questions.jsonl --out batch_output --workers 4
+
+Each input line is a JSON object with a "question" and an optional "id"
+(default: a hash of the normalized question). Questions go through
+simplify -> generate -> verify -> execute, the same QueryPipeline stages as
+the SQL Generator page, so the SQL and result caches are warmed on the way.
+Every question gets a directory under --out with
+
+- query.sql: the verified SQL that was executed,
+- result.parquet: the full query result,
+- record.json: question, simplified question, generated and verified SQL,
+  byte estimate, engine, row count, per-stage timings and any error.
+
+record.json is written last, so a question counts as done only once all
+its files are complete. Rerunning the same command after an interruption
+skips the questions that already finished; --retry-failed also reruns the
+ones that ended in an error.
+"""
+import argparse
+import contextvars
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pipeline import QueryPipeline
+from query_simplifier import partial_simplified_query
+from sql_cache import normalize_question
+from tracing import start_trace, get_trace_spans
+
+BATCH_OUTPUT_DIR = os.environ.get("BATCH_OUTPUT_DIR", "batch_output")
+# Questions in flight at once; each one makes up to three model calls and one query job.
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 4))
+BATCH_PROJECT_ID = os.environ.get("BATCH_PROJECT_ID", "bigquery-public-data")
+BATCH_USERNAME = os.environ.get("BATCH_USERNAME", "batch")
+
+
+def read_questions(path):
+    """Parses the JSONL input into a list of {"id", "question"} dicts, in file order.
+
+    Ids key the output directories, so a repeated id (given, or hashed from
+    the same question) is rejected.
+    """
+    questions = []
+    seen = {}
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            question = item.get("question", "").strip()
+            if not question:
+                raise ValueError(f"{path}:{line_number}: missing \"question\"")
+            question_id = str(item.get("id") or hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()[:12])
+            if question_id in seen:
+                raise ValueError(f"{path}:{line_number}: duplicate id {question_id!r} (first used on line {seen[question_id]})")
+            seen[question_id] = line_number
+            questions.append({"id": question_id, "question": question})
+    return questions
+
+
+def _record_path(out_dir, question_id):
+    return os.path.join(out_dir, question_id, "record.json")
+
+
+def load_record(out_dir, question_id):
+    try:
+        with open(_record_path(out_dir, question_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_text(path, text):
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            f.write(text)
+    _write_atomic(path, write)
+
+
+def _span_timings(spans):
+    timings = {}
+    for finished in spans:
+        timings[finished.name] = round(timings.get(finished.name, 0.0) + finished.duration_seconds * 1000, 3)
+    return timings
+
+
+def run_question(item, schema, out_dir, mode=None, project_id=BATCH_PROJECT_ID, username=BATCH_USERNAME, with_insights=False):
+    """Runs one question end to end and writes its files; returns its record."""
+    import pyarrow.parquet as pq
+
+    question_dir = os.path.join(out_dir, item["id"])
+    os.makedirs(question_dir, exist_ok=True)
+    start_trace()
+    record = {"id": item["id"], "question": item["question"], "status": "ok", "error": None}
+    timings = {}
+    started = time.perf_counter()
+    pipeline = QueryPipeline(mode=mode, executor=None)
+    pipeline.set_inputs(question=item["question"], schema=schema, project_id=project_id, username=username, run_id=0)
+    try:
+        step_started = time.perf_counter()
+        verified_sql = pipeline.resolve_sql()
+        timings["sql"] = time.perf_counter() - step_started
+        record.update(
+            simplified_question=partial_simplified_query(pipeline.get("simplify")),
+            generated_sql=pipeline.get("generate"),
+            verified_sql=verified_sql,
+            sql_from_cache=pipeline.sql_from_cache(),
+            sql_shared=pipeline.sql_shared(),
+        )
+        if not verified_sql:
+            raise ValueError("The model returned no SQL")
+        record["engine"] = pipeline.get("engine")
+        record["executed_sql"] = pipeline.get("rewrite")
+        _write_text(os.path.join(question_dir, "query.sql"), record["executed_sql"] + "\n")
+
+        step_started = time.perf_counter()
+        record["estimated_bytes"] = pipeline.get("estimate")
+        timings["estimate"] = time.perf_counter() - step_started
+
+        step_started = time.perf_counter()
+        result = pipeline.get("execute")
+        timings["execute"] = time.perf_counter() - step_started
+        query_result = result["result"]
+        _write_atomic(os.path.join(question_dir, "result.parquet"), lambda path: pq.write_table(query_result.table, path))
+        record.update(
+            rows=query_result.num_rows,
+            result_from_cache=result.get("from_cache", False),
+            result_shared=result.get("shared", False),
+            truncated=result.get("truncated", False),
+        )
+
+        if with_insights:
+            step_started = time.perf_counter()
+            record["insight"] = pipeline.get("insights")
+            timings["insights"] = time.perf_counter() - step_started
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    timings["total"] = time.perf_counter() - started
+    record["timings_ms"] = {name: round(seconds * 1000, 3) for name, seconds in timings.items()}
+    record["spans_ms"] = _span_timings(get_trace_spans())
+    record["finished_at"] = time.time()
+    _write_text(_record_path(out_dir, item["id"]), json.dumps(record, indent=2, default=str))
+    return record
+
+
+def run_batch(questions, out_dir=BATCH_OUTPUT_DIR, workers=BATCH_WORKERS, mode=None, retry_failed=False, with_insights=False):
+    """Runs every question not finished by an earlier run; returns the records of this run."""
+    from sql_generation import get_bigquery_table_schema_text
+
+    pending = []
+    for item in questions:
+        previous = load_record(out_dir, item["id"])
+        if previous is None or (retry_failed and previous.get("status") != "ok"):
+            pending.append(item)
+    print(f"{len(questions) - len(pending)} of {len(questions)} questions already done; running {len(pending)}")
+    if not pending:
+        return []
+    os.makedirs(out_dir, exist_ok=True)
+    schema = get_bigquery_table_schema_text()
+    records = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # Each question runs in its own copy of the context, so its trace holds only its own spans.
+        futures = [
+            executor.submit(contextvars.copy_context().run, run_question, item, schema, out_dir, mode, with_insights=with_insights)
+            for item in pending
+        ]
+        try:
+            for future in as_completed(futures):
+                record = future.result()
+                records.append(record)
+                detail = record["error"] or f"{record.get('rows', 0)} rows in {record['timings_ms']['total']:.0f} ms"
+                print(f"[{len(records)}/{len(pending)}] {record['id']} {record['status']}: {detail}")
+        except KeyboardInterrupt:
+            # Finished questions keep their records; rerun the command to resume.
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("questions", help="JSONL file with one {\"question\": ..., \"id\": ...} per line")
+    parser.add_argument("--out", default=BATCH_OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--mode", choices=("accurate", "fast"), default=None, help="pipeline mode (default: PIPELINE_MODE)")
+    parser.add_argument("--retry-failed", action="store_true", help="rerun questions whose earlier run ended in an error")
+    parser.add_argument("--insights", action="store_true", help="also generate the insight text for each result")
+    args = parser.parse_args()
+
+    try:
+        questions = read_questions(args.questions)
+    except ValueError as e:
+        sys.exit(f"Invalid input: {e}")
+    records = run_batch(questions, args.out, args.workers, args.mode, args.retry_failed, args.insights)
+    failed = [record for record in records if record["status"] != "ok"]
+    print(f"{len(records) - len(failed)} succeeded, {len(failed)} failed; output in {args.out}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
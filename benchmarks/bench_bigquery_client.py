@@ -0,0 +1,60 @@
+"""Per-call overhead of building a fresh `bigquery.Client` versus the shared provider.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_bigquery_client --iterations 200
+
+Client construction alone (credential discovery plus a new HTTP session) is
+measured, so no BigQuery jobs are submitted. Pass `--get-table` to also time
+one metadata round-trip per call, which shows the connection reuse.
+"""
+import argparse
+import statistics
+import time
+
+from google.cloud import bigquery
+
+from bigquery_client import get_bigquery_client, reset_bigquery_clients
+
+project_id = "bigquery-public-data"
+table_ref = "bigquery-public-data.san_francisco_311.311_service_requests"
+
+
+def _time_calls(make_client, iterations, get_table):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        client = make_client()
+        if get_table:
+            client.get_table(table_ref)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _report(label, timings):
+    timings_ms = [t * 1000 for t in timings]
+    print(
+        f"{label:<22} mean={statistics.mean(timings_ms):8.3f} ms  "
+        f"p50={statistics.median(timings_ms):8.3f} ms  "
+        f"max={max(timings_ms):8.3f} ms"
+    )
+    return statistics.mean(timings_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--get-table", action="store_true")
+    args = parser.parse_args()
+
+    per_call = _time_calls(lambda: bigquery.Client(project=project_id), args.iterations, args.get_table)
+    reset_bigquery_clients()
+    shared = _time_calls(lambda: get_bigquery_client(project_id), args.iterations, args.get_table)
+
+    per_call_mean = _report("bigquery.Client()", per_call)
+    shared_mean = _report("get_bigquery_client()", shared)
+    print(f"saved per call: {per_call_mean - shared_mean:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Figure JSON size and build time against row count, raw Plotly Express versus generate_chart.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_chart_size --rows 1000 10000 100000 1000000
+
+"raw" builds the figure the way generate_chart did before the reduction layer
+(px.line / px.scatter / px.histogram / px.bar / px.pie over every row).
+"reduced" goes through generate_chart. Build time includes `fig.to_json()`,
+which is what Streamlit sends to the browser.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from chart_generation import generate_chart
+
+SUGGESTIONS = {
+    "line": "Chart type: line\nX-axis: created_at\nY-axis: request_count\nValues: N/A",
+    "scatter": "Chart type: scatter\nX-axis: lat\nY-axis: resolution_hours\nValues: N/A",
+    "histogram": "Chart type: histogram\nX-axis: N/A\nY-axis: N/A\nValues: resolution_hours",
+    "bar": "Chart type: bar\nX-axis: street\nY-axis: request_count\nValues: N/A",
+    "pie": "Chart type: pie\nX-axis: N/A\nY-axis: N/A\nValues: request_count\nLabels: street",
+}
+
+
+def synthetic_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "created_at": pd.date_range("2010-01-01", periods=rows, freq="min"),
+        "request_count": rng.poisson(20, rows).cumsum() % 1000,
+        "lat": rng.normal(37.76, 0.03, rows),
+        "resolution_hours": rng.exponential(48, rows),
+        "street": np.array([f"Street {i}" for i in range(max(rows // 10, 1))], dtype=object)[rng.integers(0, max(rows // 10, 1), rows)],
+    })
+
+
+def raw_figure(df, chart_type):
+    if chart_type == "line":
+        return px.line(df, x="created_at", y="request_count")
+    if chart_type == "scatter":
+        return px.scatter(df, x="lat", y="resolution_hours")
+    if chart_type == "histogram":
+        return px.histogram(df, x="resolution_hours")
+    if chart_type == "bar":
+        return px.bar(df, x="street", y="request_count")
+    return px.pie(df, names="street", values="request_count")
+
+
+def _measure(build):
+    start = time.perf_counter()
+    fig = build()
+    payload = fig.to_json()
+    return len(payload), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--charts", nargs="+", default=list(SUGGESTIONS), choices=list(SUGGESTIONS))
+    args = parser.parse_args()
+
+    print(f"{'chart':<10}{'rows':>10}{'raw KB':>12}{'raw s':>9}{'reduced KB':>12}{'reduced s':>11}")
+    for rows in args.rows:
+        df = synthetic_frame(rows)
+        for chart_type in args.charts:
+            raw_size, raw_time = _measure(lambda: raw_figure(df, chart_type))
+            reduced_size, reduced_time = _measure(lambda: generate_chart(df, SUGGESTIONS[chart_type]))
+            print(
+                f"{chart_type:<10}{rows:>10}{raw_size / 1024:>12.1f}{raw_time:>9.2f}"
+                f"{reduced_size / 1024:>12.1f}{reduced_time:>11.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
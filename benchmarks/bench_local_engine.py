@@ -0,0 +1,69 @@
+"""Latency of typical generated queries on the local DuckDB snapshot, optionally against BigQuery.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_local_engine --rows 1000000 --repeat 5
+    python -m benchmarks.bench_local_engine --bigquery          # also time the remote table
+
+Without `--bigquery` everything runs offline: a synthetic snapshot of `--rows`
+rows is written to LOCAL_SNAPSHOT_DIR first unless `--keep-snapshot` is given
+and a snapshot already exists.
+"""
+import argparse
+import statistics
+import time
+
+import local_engine
+from query_execution import run_query_to_arrow
+
+TABLE = f"`{local_engine.TABLE_ID}`"
+
+QUERIES = {
+    "count_by_service": f"SELECT service_name, COUNT(*) AS request_count FROM {TABLE} GROUP BY service_name ORDER BY request_count DESC",
+    "monthly_trend": (
+        f"SELECT FORMAT_TIMESTAMP('%Y-%m', requested_datetime) AS month, COUNT(*) AS request_count FROM {TABLE} "
+        "WHERE EXTRACT(YEAR FROM requested_datetime) = 2020 GROUP BY month ORDER BY month"
+    ),
+    "resolution_by_neighborhood": (
+        f"SELECT neighborhood, AVG(TIMESTAMP_DIFF(closed_date, requested_datetime, HOUR)) AS avg_hours FROM {TABLE} "
+        "WHERE closed_date IS NOT NULL GROUP BY neighborhood ORDER BY avg_hours DESC LIMIT 10"
+    ),
+    "filtered_rows": f"SELECT service_request_id, address, status FROM {TABLE} WHERE service_subtype = 'Pothole' LIMIT 1000",
+}
+
+
+def _time(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        table = run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), table.num_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep-snapshot", action="store_true")
+    parser.add_argument("--bigquery", action="store_true")
+    args = parser.parse_args()
+
+    if not (args.keep_snapshot and local_engine.get_snapshot_metadata()):
+        start = time.perf_counter()
+        local_engine.write_synthetic_snapshot(args.rows)
+        print(f"Wrote a {args.rows}-row synthetic snapshot in {time.perf_counter() - start:.2f}s")
+
+    header = f"{'query':<30}{'rows':>8}{'local ms':>12}"
+    print(header + (f"{'bigquery ms':>14}" if args.bigquery else ""))
+    for name, sql in QUERIES.items():
+        local_seconds, rows = _time(lambda: run_query_to_arrow(local_engine.project_id, sql, engine="local"), args.repeat)
+        line = f"{name:<30}{rows:>8}{local_seconds * 1000:>12.1f}"
+        if args.bigquery:
+            remote_seconds, _ = _time(lambda: run_query_to_arrow(local_engine.project_id, sql, engine="bigquery"), args.repeat)
+            line += f"{remote_seconds * 1000:>14.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
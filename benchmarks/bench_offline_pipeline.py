@@ -0,0 +1,138 @@
+"""Per-stage and end-to-end latency of the NL -> chart pipeline, offline, against fake Gemini and BigQuery clients.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_offline_pipeline --repeats 3
+    python -m benchmarks.bench_offline_pipeline --time-scale 0 --repeats 20      # local overhead only
+    python -m benchmarks.bench_offline_pipeline --flow pipeline --mode fast
+    python -m benchmarks.bench_offline_pipeline --latency insights=2500:6000
+
+The fakes in `benchmarks.fakes` answer every question in `benchmarks.corpus`
+with its recorded response after a lognormal delay. The delay comes from
+DEFAULT_LATENCIES, overridden with `--latency NAME=P50:P95` (ms) and
+multiplied by `--time-scale`. Queries run on the local snapshot, and a
+synthetic one is written if LOCAL_SNAPSHOT_DIR has none.
+
+`--flow direct` calls simplify_query, generate_sql, verify_query,
+run_query_in_bigquery, insights, generate_chart_suggestion and
+generate_chart one after another. It reports each stage's wall time and
+its overhead, which is wall time minus simulated latency, so a code
+regression shows up even with `--time-scale 0`. `--flow pipeline` drives
+QueryPipeline with its concurrency and shortcuts and reports the end-to-end
+time. The SQL and result caches are bypassed in both flows.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.corpus import CORPUS
+from benchmarks.fakes import DEFAULT_LATENCIES, Latency, install_fakes
+from chart_generation import generate_chart, generate_chart_suggestion
+from insights_generation import insights
+from pipeline import QueryPipeline
+from query_execution import run_query_in_bigquery
+from query_simplifier import simplify_query
+from query_verification import verify_query
+from result_cache import clear_cache as clear_result_cache
+from result_profiling import profile_result_json
+from sql_generation import generate_sql, get_bigquery_table_schema_text
+
+project_id = "bigquery-public-data"
+DIRECT_STAGES = ["simplify", "generate", "verify", "execute", "insights", "chart_suggestion", "chart"]
+
+
+def _percentiles(values):
+    values = sorted(values)
+    return statistics.median(values), values[min(len(values) - 1, int(len(values) * 0.95))]
+
+
+class _StageTimer:
+    def __init__(self, latency):
+        self.latency = latency
+        self.wall = {}
+        self.overhead = {}
+
+    def run(self, stage, func, *args):
+        simulated = self.latency.simulated_seconds
+        start = time.perf_counter()
+        output = func(*args)
+        wall = time.perf_counter() - start
+        self.wall.setdefault(stage, []).append(wall)
+        self.overhead.setdefault(stage, []).append(wall - (self.latency.simulated_seconds - simulated))
+        return output
+
+
+def _direct(question, schema, timer):
+    simplified = timer.run("simplify", simplify_query, question, schema)
+    sql_query = timer.run("generate", generate_sql, simplified)
+    verified = json.loads(timer.run("verify", verify_query, question, sql_query, schema)).get("correct_query", sql_query)
+    df = timer.run("execute", lambda: run_query_in_bigquery(project_id, verified, engine="bigquery").dropna())
+    if df.empty:
+        return
+    insight = timer.run("insights", insights, question, profile_result_json(df, verified))
+    suggestion = timer.run("chart_suggestion", generate_chart_suggestion, df.head(25).to_string(), str(df.dtypes), question, insight)
+    timer.run("chart", lambda: generate_chart(df, suggestion) if "VISUALISATION NOT NEEDED" not in suggestion else None)
+
+
+def _pipeline(question, schema, mode):
+    pipeline = QueryPipeline(state={}, mode=mode)
+    pipeline.set_inputs(question=question, schema=schema, project_id=project_id, username="bench", run_id=0)
+    pipeline.get("estimate")
+    for _ in pipeline.post_query_stages():
+        pass
+
+
+def _parse_latencies(values):
+    latencies = {}
+    for value in values:
+        name, _, p50_p95 = value.partition("=")
+        if name not in DEFAULT_LATENCIES:
+            raise SystemExit(f"Unknown latency {name!r}; expected one of {', '.join(DEFAULT_LATENCIES)}")
+        p50, p95 = (float(part) for part in p50_p95.split(":"))
+        latencies[name] = (p50, p95)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--flow", choices=["direct", "pipeline"], default="direct")
+    parser.add_argument("--mode", choices=["accurate", "fast"], default="accurate", help="QueryPipeline mode for --flow pipeline")
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--latency", nargs="*", default=[], metavar="NAME=P50:P95")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--snapshot-rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    latency = Latency(_parse_latencies(args.latency), time_scale=args.time_scale, seed=args.seed)
+    install_fakes(latency, snapshot_rows=args.snapshot_rows)
+    schema = get_bigquery_table_schema_text()
+
+    timer = _StageTimer(latency)
+    end_to_end = []
+    for _ in range(args.repeats):
+        for entry in CORPUS:
+            clear_result_cache()
+            start = time.perf_counter()
+            if args.flow == "direct":
+                _direct(entry["question"], schema, timer)
+            else:
+                _pipeline(entry["question"], schema, args.mode)
+            end_to_end.append(time.perf_counter() - start)
+
+    print(f"{len(end_to_end)} runs, flow={args.flow}" + (f", mode={args.mode}" if args.flow == "pipeline" else "") + f", time scale {args.time_scale}")
+    print(f"{'stage':<18}{'p50 ms':>10}{'p95 ms':>10}{'overhead p50':>14}{'overhead p95':>14}")
+    for stage in DIRECT_STAGES if args.flow == "direct" else []:
+        if stage not in timer.wall:
+            continue
+        wall_p50, wall_p95 = _percentiles(timer.wall[stage])
+        overhead_p50, overhead_p95 = _percentiles(timer.overhead[stage])
+        print(f"{stage:<18}{wall_p50 * 1000:>10.1f}{wall_p95 * 1000:>10.1f}{overhead_p50 * 1000:>14.1f}{overhead_p95 * 1000:>14.1f}")
+    e2e_p50, e2e_p95 = _percentiles(end_to_end)
+    print(f"{'end_to_end':<18}{e2e_p50 * 1000:>10.1f}{e2e_p95 * 1000:>10.1f}")
+    print("fake calls: " + ", ".join(f"{kind}={count}" for kind, count in sorted(latency.calls.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Latency and token usage of the "accurate" versus "fast" SQL pipeline modes.
+
+Run from the repository root (needs Vertex AI and BigQuery credentials):
+
+    python -m benchmarks.bench_pipeline_modes --repeats 2
+
+Each question in QUESTIONS is resolved to verified SQL in both modes with the
+persistent SQL cache bypassed. Token counts come from the `usage_metadata` of
+every model response made while resolving the question.
+"""
+import argparse
+import statistics
+import time
+
+import chart_generation
+import insights_generation
+import query_fast_path
+import query_simplifier
+import query_verification
+import sql_generation
+from model_client import get_model_client
+from pipeline import QueryPipeline
+from sql_generation import get_bigquery_table_schema_text
+
+QUESTIONS = [
+    "How many noise complaints were reported in 2023?",
+    "Which neighborhood had the most pothole complaints last year?",
+    "Compare graffiti requests submitted by phone vs the mobile app in 2022",
+    "What are the top 5 agencies by number of open requests?",
+    "How has the number of street cleaning requests changed month by month in 2023?",
+    "Which hour of the day gets the most abandoned vehicle reports?",
+    "What is the average time to close sewer issues by neighborhood?",
+    "Show the share of requests by source for 2021",
+]
+
+_usage = {"calls": 0, "prompt_tokens": 0, "response_tokens": 0}
+
+
+def _record_usage(models):
+    generate_content = models.generate_content
+
+    def recording_generate_content(*args, **kwargs):
+        response = generate_content(*args, **kwargs)
+        usage = getattr(response, "usage_metadata", None)
+        _usage["calls"] += 1
+        if usage is not None:
+            _usage["prompt_tokens"] += usage.prompt_token_count or 0
+            _usage["response_tokens"] += usage.candidates_token_count or 0
+        return response
+
+    models.generate_content = recording_generate_content
+
+
+def _run_mode(mode, schema, repeats):
+    latencies = []
+    _usage.update(calls=0, prompt_tokens=0, response_tokens=0)
+    for _ in range(repeats):
+        for question in QUESTIONS:
+            pipeline = QueryPipeline(mode=mode)
+            pipeline.set_inputs(question=question, schema=schema, project_id="bigquery-public-data", run_id=0)
+            start = time.perf_counter()
+            pipeline.get("verify")
+            latencies.append(time.perf_counter() - start)
+    runs = len(latencies)
+    latencies.sort()
+    return {
+        "p50_s": statistics.median(latencies),
+        "p95_s": latencies[min(runs - 1, int(runs * 0.95))],
+        "calls_per_question": _usage["calls"] / runs,
+        "prompt_tokens_per_question": _usage["prompt_tokens"] / runs,
+        "response_tokens_per_question": _usage["response_tokens"] / runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args()
+
+    seen = set()
+    for module in (sql_generation, query_simplifier, query_verification, query_fast_path, insights_generation, chart_generation):
+        models = (module.client or get_model_client(module.project_id)).models
+        if id(models) not in seen:
+            seen.add(id(models))
+            _record_usage(models)
+
+    schema = get_bigquery_table_schema_text()
+    print(f"{'mode':<10}{'p50 s':>8}{'p95 s':>8}{'calls':>8}{'prompt tok':>12}{'resp tok':>10}")
+    for mode in ("accurate", "fast"):
+        stats = _run_mode(mode, schema, args.repeats)
+        print(
+            f"{mode:<10}{stats['p50_s']:>8.2f}{stats['p95_s']:>8.2f}{stats['calls_per_question']:>8.1f}"
+            f"{stats['prompt_tokens_per_question']:>12.0f}{stats['response_tokens_per_question']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
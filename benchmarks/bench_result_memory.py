@@ -0,0 +1,96 @@
+"""Peak RSS of the old pandas result path versus the Arrow-backed QueryResult path.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_result_memory --rows 1000000
+
+Each path runs in its own subprocess on the same synthetic 311-shaped result.
+The reported number is the peak RSS growth after the synthetic Arrow table
+(standing in for the BigQuery download) has been built.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+
+import numpy as np
+import pyarrow as pa
+
+from query_execution import QueryResult
+
+
+def synthetic_result(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    neighborhoods = np.array([f"Neighborhood {i}" for i in range(40)], dtype=object)
+    subtypes = np.array([f"Subtype {i}" for i in range(120)], dtype=object)
+    created = np.datetime64("2015-01-01T00:00:00") + rng.integers(0, 10 * 365 * 86400, rows).astype("timedelta64[s]")
+    counts = rng.integers(1, 500, rows).astype(float)
+    counts[rng.random(rows) < 0.01] = np.nan
+    return pa.table({
+        "neighborhood": pa.array(neighborhoods[rng.integers(0, len(neighborhoods), rows)]),
+        "service_subtype": pa.array(subtypes[rng.integers(0, len(subtypes), rows)]),
+        "created_at": pa.array(created, type=pa.timestamp("us", tz="UTC")),
+        "request_count": pa.array(counts, from_pandas=True),
+        "lat": pa.array(rng.normal(37.76, 0.03, rows)),
+    })
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _run_pandas_path(table):
+    # Mirrors the pre-Arrow app.py: to_dataframe, repeated dropna, string copy for display.
+    df = table.to_pandas()
+    df = df.dropna()
+    df = df.dropna()
+    df_display = df.copy().astype(str)
+    df_json = df.head(250).to_json(orient="records")
+    df_head = df.head(25).to_string()
+    df = df.dropna()
+    return len(df_display) + len(df_json) + len(df_head) + len(df)
+
+
+def _run_arrow_path(table):
+    query_result = QueryResult(table)
+    display = query_result.table
+    payload = json.dumps(query_result.head(250).to_pylist(), default=str)
+    chart_df = query_result.to_pandas()
+    df_head = chart_df.head(25).to_string()
+    return display.num_rows + len(payload) + len(df_head) + len(chart_df)
+
+
+def _child(path, rows):
+    table = synthetic_result(rows)
+    baseline = _peak_rss_bytes()
+    run = _run_pandas_path if path == "pandas" else _run_arrow_path
+    run(table)
+    print(json.dumps({"path": path, "peak_growth_bytes": _peak_rss_bytes() - baseline}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--child", choices=["pandas", "arrow"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child, args.rows)
+        return
+
+    results = {}
+    for path in ("pandas", "arrow"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_result_memory", "--rows", str(args.rows), "--child", path],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[path] = json.loads(output.strip().splitlines()[-1])["peak_growth_bytes"]
+        print(f"{path:<8} peak RSS growth: {results[path] / 1024 ** 2:8.1f} MiB")
+    if results["arrow"]:
+        print(f"reduction: {results['pandas'] / results['arrow']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Base table versus rollup latency for typical COUNT queries, on the local snapshot.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rollups --rows 1000000 --repeat 5
+
+A synthetic snapshot of `--rows` rows and its rollups are written to
+LOCAL_SNAPSHOT_DIR first unless `--keep-snapshot` is given. Each query runs
+as written and as rewritten by `rewrite_for_rollups`, and the results are
+checked to be identical.
+"""
+import argparse
+import os
+import statistics
+import time
+
+import local_engine
+import rollups
+
+TABLE = f"`{local_engine.TABLE_ID}`"
+
+QUERIES = {
+    "pothole_by_neighborhood": (
+        f"SELECT neighborhood, COUNT(*) AS pothole_requests FROM {TABLE} "
+        "WHERE EXTRACT(YEAR FROM created_at) = 2020 AND LOWER(service_subtype) LIKE '%pothole%' "
+        "GROUP BY neighborhood ORDER BY pothole_requests DESC LIMIT 100"
+    ),
+    "monthly_volume": f"SELECT FORMAT_TIMESTAMP('%Y-%m', created_at) AS month, COUNT(*) AS request_count FROM {TABLE} GROUP BY month ORDER BY month",
+    "daily_by_source": (
+        f"SELECT DATE(created_at) AS day, source, COUNT(*) AS request_count FROM {TABLE} "
+        "WHERE created_at >= '2020-03-01' AND created_at < '2020-04-01' GROUP BY day, source ORDER BY day, source"
+    ),
+    "yearly_by_agency": (
+        f"SELECT EXTRACT(YEAR FROM created_at) AS year, agency_responsible, COUNT(*) AS request_count FROM {TABLE} "
+        "GROUP BY year, agency_responsible ORDER BY year, request_count DESC"
+    ),
+}
+
+
+def _time(sql, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        table = local_engine.run_local_query(sql)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep-snapshot", action="store_true")
+    args = parser.parse_args()
+
+    if not (args.keep_snapshot and local_engine.get_snapshot_metadata()):
+        local_engine.write_synthetic_snapshot(args.rows)
+    rollups.build_local_rollups()
+    print(f"snapshot: {os.path.getsize(local_engine.snapshot_path()) / 1024:.0f} KB")
+
+    print(f"{'query':<26}{'rollup':<36}{'base ms':>10}{'rollup ms':>11}{'rollup KB':>11}  same")
+    for name, sql in QUERIES.items():
+        rewritten = rollups.rewrite_for_rollups(sql, "local")
+        base_seconds, base = _time(sql, args.repeat)
+        rollup_seconds, answer = _time(rewritten, args.repeat)
+        rollup_name = next((rollup for rollup, _, _ in rollups.ROLLUPS if f"`{rollups.rollup_table_id(rollup)}`" in rewritten), None)
+        size = os.path.getsize(os.path.join(rollups.rollup_dir(), f"{rollup_name}.parquet")) / 1024 if rollup_name else 0
+        print(
+            f"{name:<26}{rollup_name or '(not rewritten)':<36}{base_seconds * 1000:>10.1f}"
+            f"{rollup_seconds * 1000:>11.1f}{size:>11.0f}  {base.equals(answer)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
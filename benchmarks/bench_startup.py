@@ -0,0 +1,78 @@
+"""Cold import time of the app, with a budget.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup --repeats 5 --budget-ms 2000
+
+Each repeat imports `app` in a fresh interpreter under `python -X importtime`
+and reports the median import time and the slowest modules by cumulative
+time. The run exits with status 1 when the median is over the budget or
+when a dependency that should load on first use (google-genai,
+google-cloud-bigquery, duckdb, ...) was imported at startup.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Imported on first use only; loading any of these at startup is a regression.
+DEFERRED_MODULES = ("google.genai", "google.cloud.bigquery", "google.auth", "duckdb", "plotly.express")
+STARTUP_BUDGET_MS = int(os.environ.get("STARTUP_BUDGET_MS", 2000))
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+
+def import_once(module):
+    probe = _PROBE.format(module=module, deferred=DEFERRED_MODULES)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe], capture_output=True, text=True, check=True,
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        if cumulative_us.strip().isdigit():
+            cumulative[name.strip()] = int(cumulative_us)
+    result["cumulative_us"] = cumulative
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    args = parser.parse_args()
+
+    runs = [import_once(args.module) for _ in range(args.repeats)]
+    median_ms = statistics.median(run["seconds"] for run in runs) * 1000
+    print(f"import {args.module}: median {median_ms:.0f} ms over {args.repeats} runs (budget {args.budget_ms:.0f} ms)")
+    print(f"{'module':<60} {'cumulative ms':>14}")
+    slowest = sorted(runs[-1]["cumulative_us"].items(), key=lambda item: -item[1])[:args.top]
+    for name, cumulative_us in slowest:
+        print(f"{name:<60} {cumulative_us / 1000:>14.1f}")
+
+    failed = False
+    loaded = sorted({module for run in runs for module in run["loaded"]})
+    if loaded:
+        print(f"Loaded at startup but should be deferred: {', '.join(loaded)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"Startup over budget: {median_ms:.0f} ms > {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Fixed corpus of 311 questions with recorded model responses, used by the offline benchmarks.
+
+The SQL runs on the columns of the synthetic snapshot (`local_engine.synthetic_table`).
+"""
+import json
+
+TABLE = "`bigquery-public-data.san_francisco_311.311_service_requests`"
+
+CORPUS = [
+    {
+        "question": "How many noise complaints were reported in 2023?",
+        "simplified": "Count the requests with service_name 'Noise Report' created in 2023.",
+        "sql": f"SELECT COUNT(*) AS noise_complaints\nFROM {TABLE}\nWHERE service_name = 'Noise Report'\n  AND EXTRACT(YEAR FROM created_at) = 2023",
+        "insight": "There were about 1,000 noise complaints in 2023, in line with the previous two years.",
+        "chart_suggestion": "VISUALISATION NOT NEEDED",
+    },
+    {
+        "question": "Which neighborhood had the most pothole complaints last year?",
+        "simplified": "Count pothole requests per neighborhood for last year and rank the neighborhoods.",
+        "sql": (
+            f"SELECT neighborhood, COUNT(*) AS pothole_requests\nFROM {TABLE}\n"
+            "WHERE EXTRACT(YEAR FROM created_at) = EXTRACT(YEAR FROM CURRENT_DATE()) - 1\n"
+            "  AND LOWER(service_subtype) LIKE '%pothole%'\nGROUP BY neighborhood\nORDER BY pothole_requests DESC\nLIMIT 100"
+        ),
+        "insight": "Potholes were reported fairly evenly across neighborhoods last year; the Mission led by a small margin, followed by the Tenderloin and South of Market.",
+        "chart_suggestion": "Chart type: bar\nX-axis: neighborhood\nY-axis: pothole_requests\nValues: N/A",
+    },
+    {
+        "question": "Compare graffiti requests submitted by phone vs the mobile app in 2022",
+        "simplified": "Count graffiti requests in 2022 by source, for the Phone and Mobile/Open311 sources.",
+        "sql": (
+            f"SELECT source, COUNT(*) AS request_count\nFROM {TABLE}\n"
+            "WHERE service_name = 'Graffiti'\n  AND source IN ('Phone', 'Mobile/Open311')\n"
+            "  AND EXTRACT(YEAR FROM created_at) = 2022\nGROUP BY source\nORDER BY request_count DESC"
+        ),
+        "insight": "In 2022 the mobile app brought in slightly more graffiti reports than phone calls.",
+        "chart_suggestion": "Chart type: bar\nX-axis: source\nY-axis: request_count\nValues: N/A",
+    },
+    {
+        "question": "What are the top 5 agencies by number of open requests?",
+        "simplified": "Count open requests per responsible agency and return the top 5.",
+        "sql": (
+            f"SELECT agency_responsible, COUNT(*) AS open_requests\nFROM {TABLE}\n"
+            "WHERE status = 'Open'\nGROUP BY agency_responsible\nORDER BY open_requests DESC\nLIMIT 5"
+        ),
+        "insight": "The DPW operations queue holds by far the most open requests, about twice as many as the next agency.",
+        "chart_suggestion": "Chart type: bar\nX-axis: agency_responsible\nY-axis: open_requests\nValues: N/A",
+    },
+    {
+        "question": "How has the number of street cleaning requests changed month by month in 2023?",
+        "simplified": "Count Street and Sidewalk Cleaning requests per month of 2023.",
+        "sql": (
+            f"SELECT TIMESTAMP_TRUNC(created_at, MONTH) AS month, COUNT(*) AS request_count\nFROM {TABLE}\n"
+            "WHERE service_name = 'Street and Sidewalk Cleaning'\n  AND EXTRACT(YEAR FROM created_at) = 2023\n"
+            "GROUP BY month\nORDER BY month"
+        ),
+        "insight": "Street cleaning requests stayed between roughly 380 and 420 a month throughout 2023, with no clear seasonal peak.",
+        "chart_suggestion": "Chart type: line\nX-axis: month\nY-axis: request_count\nValues: N/A",
+    },
+    {
+        "question": "Which hour of the day gets the most abandoned vehicle reports?",
+        "simplified": "Count Abandoned Vehicle requests by hour of the day they were created.",
+        "sql": (
+            f"SELECT EXTRACT(HOUR FROM created_at) AS hour, COUNT(*) AS request_count\nFROM {TABLE}\n"
+            "WHERE service_name = 'Abandoned Vehicle'\nGROUP BY hour\nORDER BY hour"
+        ),
+        "insight": "Abandoned vehicle reports are spread evenly over the day, at roughly 4% of the total per hour.",
+        "chart_suggestion": "Chart type: bar\nX-axis: hour\nY-axis: request_count\nValues: N/A",
+    },
+    {
+        "question": "What is the average time to close sewer issues by neighborhood?",
+        "simplified": "Average hours between requested_datetime and closed_date for closed Sewer Issues requests, per neighborhood.",
+        "sql": (
+            f"SELECT neighborhood, AVG(TIMESTAMP_DIFF(closed_date, requested_datetime, HOUR)) AS avg_hours_to_close\nFROM {TABLE}\n"
+            "WHERE service_name = 'Sewer Issues'\n  AND closed_date IS NOT NULL\nGROUP BY neighborhood\nORDER BY avg_hours_to_close DESC"
+        ),
+        "insight": "Sewer issues take about three days to close on average, with little difference between neighborhoods.",
+        "chart_suggestion": "Chart type: bar\nX-axis: neighborhood\nY-axis: avg_hours_to_close\nValues: N/A",
+    },
+    {
+        "question": "Show the share of requests by source for 2021",
+        "simplified": "Count requests created in 2021 per source.",
+        "sql": (
+            f"SELECT source, COUNT(*) AS request_count\nFROM {TABLE}\n"
+            "WHERE EXTRACT(YEAR FROM created_at) = 2021\nGROUP BY source\nORDER BY request_count DESC"
+        ),
+        "insight": "In 2021 the mobile app was the largest channel at about 40% of requests, followed by phone at 35%.",
+        "chart_suggestion": "Chart type: pie\nX-axis: N/A\nY-axis: N/A\nValues: request_count\nLabels: source",
+    },
+    {
+        "question": "Show the location of every pothole request since 2015",
+        "simplified": "Latitude and longitude of all Pothole requests created since 2015.",
+        "sql": (
+            f"SELECT lat, long\nFROM {TABLE}\n"
+            "WHERE service_subtype = 'Pothole'\n  AND created_at >= '2015-01-01'"
+        ),
+        "insight": "Pothole reports since 2015 cluster around the city centre and thin out towards the western neighborhoods.",
+        "chart_suggestion": "Chart type: scatter\nX-axis: long\nY-axis: lat\nValues: N/A",
+    },
+    {
+        "question": "List the most recent graffiti requests in the Mission",
+        "simplified": "The latest 100 Graffiti requests in the Mission neighborhood.",
+        "sql": (
+            f"SELECT service_request_id, created_at, address, status\nFROM {TABLE}\n"
+            "WHERE service_name = 'Graffiti'\n  AND neighborhood = 'Mission'\nORDER BY created_at DESC\nLIMIT 100"
+        ),
+        "insight": "The most recent graffiti reports in the Mission are mostly closed already.",
+        "chart_suggestion": "VISUALISATION NOT NEEDED",
+    },
+]
+
+
+def response_text(entry, kind):
+    """The recorded model response of kind `kind` for a corpus entry, as the app's prompts expect it."""
+    if kind == "simplify":
+        return json.dumps({"simplified_user_query": entry["simplified"]})
+    if kind == "generate":
+        return f"```sql\n{entry['sql']}\n```"
+    if kind == "verify":
+        return json.dumps({"correct_query": entry["sql"]})
+    if kind == "fused":
+        return json.dumps({
+            "simplified_user_query": entry["simplified"],
+            "sql_query": entry["sql"],
+            "self_check": {"passed": True, "issues": []},
+        })
+    if kind == "insights":
+        return entry["insight"]
+    if kind == "chart_suggestion":
+        return entry["chart_suggestion"]
+    raise ValueError(f"Unknown response kind {kind!r}")
+
+
+def find_entry(text):
+    """The corpus entry whose question or simplified question appears in a prompt."""
+    for entry in CORPUS:
+        if entry["question"] in text or entry["simplified"] in text:
+            return entry
+    return None
@@ -0,0 +1,216 @@
+"""Stand-ins for `genai.Client` and `bigquery.Client` that answer from recorded responses after a simulated delay.
+
+`install_fakes()` swaps them into the app modules, so every code path runs
+as usual without Vertex AI or BigQuery. Model calls answer from
+`benchmarks.corpus`, and queries run on the local DuckDB snapshot.
+"""
+import math
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+import bigquery_client
+import call_limits
+import chart_generation
+import insights_generation
+import local_engine
+import query_fast_path
+import query_simplifier
+import query_verification
+import schema_catalog
+import sql_generation
+from benchmarks.corpus import find_entry, response_text
+
+# Recorded (p50, p95) latencies in milliseconds: gemini-2.0-flash on Vertex AI
+# and interactive BigQuery jobs against the 311 table.
+DEFAULT_LATENCIES = {
+    "simplify": (700, 1600),
+    "generate": (1100, 2600),
+    "verify": (1300, 3000),
+    "fused": (1600, 3400),
+    "insights": (1800, 4200),
+    "chart_suggestion": (800, 1900),
+    "bigquery_query": (1400, 4500),
+    "bigquery_dry_run": (250, 700),
+    "bigquery_metadata": (120, 300),
+}
+# Share of a streamed response's latency spent before the first chunk.
+STREAM_FIRST_CHUNK_FRACTION = 0.3
+STREAM_CHUNK_CHARS = 40
+# Bytes a fake dry run reports, roughly a full scan of a few columns of the real table.
+FAKE_BYTES_PROCESSED = 1_500_000_000
+
+_MODULE_KINDS = [
+    (query_simplifier, "simplify"),
+    (sql_generation, "generate"),
+    (query_verification, "verify"),
+    (query_fast_path, "fused"),
+    (insights_generation, "insights"),
+    (chart_generation, "chart_suggestion"),
+]
+
+
+class Latency:
+    """Lognormal delays with the given p50 and p95, scaled by `time_scale` (0 makes every call instant)."""
+
+    def __init__(self, latencies=None, time_scale=1.0, seed=0):
+        self.latencies = dict(DEFAULT_LATENCIES, **(latencies or {}))
+        self.time_scale = time_scale
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.simulated_seconds = 0.0
+        self.calls = {}
+
+    def sample(self, kind):
+        p50, p95 = self.latencies[kind]
+        sigma = math.log(p95 / p50) / 1.645 if p95 > p50 else 0.0
+        with self._lock:
+            seconds = p50 * math.exp(sigma * self._random.gauss(0, 1)) / 1000 * self.time_scale
+            self.simulated_seconds += seconds
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+        return seconds
+
+    def wait(self, kind):
+        time.sleep(self.sample(kind))
+
+
+def _contents_text(contents):
+    texts = []
+    for content in contents if isinstance(contents, list) else [contents]:
+        parts = content.get("parts", []) if isinstance(content, dict) else (getattr(content, "parts", None) or [])
+        for part in parts:
+            texts.append(part.get("text", "") if isinstance(part, dict) else (getattr(part, "text", None) or ""))
+        if isinstance(content, str):
+            texts.append(content)
+    return "\n".join(texts)
+
+
+def _system_text(config):
+    system = getattr(config, "system_instruction", None) or []
+    if isinstance(system, str):
+        return system
+    return "\n".join(getattr(part, "text", None) or "" for part in system)
+
+
+def _usage(prompt, text):
+    # About four characters per token.
+    return SimpleNamespace(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4)
+
+
+class _FakeModels:
+    def __init__(self, kind, latency):
+        self.kind = kind
+        self.latency = latency
+
+    def _answer(self, contents, config):
+        # The user turn decides; system instructions may quote corpus questions as examples.
+        user_text = _contents_text(contents)
+        prompt = f"{_system_text(config)}\n{user_text}"
+        entry = find_entry(user_text) or find_entry(prompt)
+        if entry is None:
+            raise KeyError(f"No recorded {self.kind} response for this prompt")
+        return prompt, response_text(entry, self.kind)
+
+    def generate_content(self, model=None, contents=None, config=None):
+        prompt, text = self._answer(contents, config)
+        self.latency.wait(self.kind)
+        return SimpleNamespace(text=text, usage_metadata=_usage(prompt, text))
+
+    def generate_content_stream(self, model=None, contents=None, config=None):
+        prompt, text = self._answer(contents, config)
+        seconds = self.latency.sample(self.kind)
+        chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+        time.sleep(seconds * STREAM_FIRST_CHUNK_FRACTION)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(seconds * (1 - STREAM_FIRST_CHUNK_FRACTION) / (len(chunks) - 1))
+            yield SimpleNamespace(text=chunk, usage_metadata=_usage(prompt, chunk))
+
+
+class FakeGenaiClient:
+    """Answers `models.generate_content(_stream)` with the recorded response of one kind."""
+
+    def __init__(self, kind, latency):
+        self.models = _FakeModels(kind, latency)
+
+
+class _FakeRowIterator:
+    def __init__(self, table, page_size=None):
+        self.table = table
+        self.page_size = page_size
+        self.total_rows = table.num_rows
+
+    def to_arrow(self, bqstorage_client=None):
+        return self.table
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        yield from self.table.to_batches(max_chunksize=self.page_size or 100_000)
+
+    def to_dataframe(self, bqstorage_client=None):
+        return self.table.to_pandas()
+
+    def __iter__(self):
+        return iter(self.table.to_pylist())
+
+
+class _FakeQueryJob:
+    def __init__(self, table, bytes_processed):
+        self.errors = None
+        self.total_bytes_processed = bytes_processed
+        self.total_bytes_billed = bytes_processed if table is not None else 0
+        self._table = table
+
+    def result(self, page_size=None):
+        return _FakeRowIterator(self._table, page_size)
+
+
+class FakeBigQueryClient:
+    """Runs queries on the local DuckDB snapshot after a simulated BigQuery delay."""
+
+    def __init__(self, latency, bytes_processed=FAKE_BYTES_PROCESSED):
+        self.latency = latency
+        self.bytes_processed = bytes_processed
+
+    def query(self, query, job_config=None):
+        if job_config is not None and job_config.dry_run:
+            local_engine.transpile_to_duckdb(query)
+            self.latency.wait("bigquery_dry_run")
+            return _FakeQueryJob(None, self.bytes_processed)
+        table = local_engine.run_local_query(query)
+        self.latency.wait("bigquery_query")
+        return _FakeQueryJob(table, self.bytes_processed)
+
+    def get_table(self, table_ref):
+        self.latency.wait("bigquery_metadata")
+        arrow_schema = pq.read_schema(local_engine.snapshot_path())
+        field_types = {"string": "STRING", "double": "FLOAT", "int64": "INTEGER", "bool": "BOOLEAN"}
+        schema = [
+            bigquery.SchemaField(field.name, "TIMESTAMP" if str(field.type).startswith("timestamp") else field_types.get(str(field.type), "STRING"))
+            for field in arrow_schema
+        ]
+        return SimpleNamespace(table_id=str(table_ref).split(".")[-1], schema=schema, modified=local_engine.get_snapshot_metadata()["synced_at"])
+
+    def close(self):
+        pass
+
+
+def install_fakes(latency, project_ids=("bigquery-public-data", None), snapshot_rows=200_000):
+    """Points every model and BigQuery call in the app at the fakes and turns the rate limits off.
+
+    A synthetic snapshot of `snapshot_rows` rows is written when there is none yet.
+    """
+    if local_engine.get_snapshot_metadata() is None:
+        local_engine.write_synthetic_snapshot(snapshot_rows)
+    # The fakes never throttle; without token buckets, measured overhead is only code.
+    call_limits.RATE_LIMITS = {kind: (0.0, burst) for kind, (_, burst) in call_limits.RATE_LIMITS.items()}
+    for module, kind in _MODULE_KINDS:
+        module.client = FakeGenaiClient(kind, latency)
+    fake_bigquery = FakeBigQueryClient(latency)
+    for project_id in project_ids:
+        bigquery_client.set_bigquery_client(fake_bigquery, project_id)
+    schema_catalog.invalidate()
+    return fake_bigquery
@@ -0,0 +1,85 @@
+import os
+import threading
+
+# Size of the shared HTTP connection pool. Every Streamlit session shares the
+# same client, so this bounds how many BigQuery requests can be in flight
+# over keep-alive connections at once.
+BIGQUERY_HTTP_POOL_SIZE = int(os.environ.get("BIGQUERY_HTTP_POOL_SIZE", 32))
+
+_lock = threading.Lock()
+_clients = {}
+_storage_client = None
+_credentials = None
+
+
+def _get_credentials():
+    global _credentials
+    if _credentials is None:
+        import google.auth
+        _credentials, _ = google.auth.default(
+            scopes=["https://www.googleapis.com/auth/cloud-platform"]
+        )
+    return _credentials
+
+
+def _build_http_session(credentials, pool_size):
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_bigquery_client(project_id=None):
+    """Returns the process-wide BigQuery client for `project_id`, creating it on first use.
+
+    Credentials are discovered once and every client shares a pooled HTTP
+    session, so repeated calls reuse open connections instead of redoing the
+    auth handshake. google-cloud-bigquery is imported on first use, not at
+    app start.
+    """
+    with _lock:
+        client = _clients.get(project_id)
+        if client is None:
+            from google.cloud import bigquery
+            credentials = _get_credentials()
+            client = bigquery.Client(
+                project=project_id,
+                credentials=credentials,
+                _http=_build_http_session(credentials, BIGQUERY_HTTP_POOL_SIZE),
+            )
+            _clients[project_id] = client
+        return client
+
+
+def get_bigquery_storage_client():
+    """Returns the shared BigQuery Storage read client, or None if google-cloud-bigquery-storage is not installed."""
+    global _storage_client
+    try:
+        from google.cloud import bigquery_storage
+    except ImportError:
+        return None
+    with _lock:
+        if _storage_client is None:
+            _storage_client = bigquery_storage.BigQueryReadClient(credentials=_get_credentials())
+        return _storage_client
+
+
+def set_bigquery_client(client, project_id=None):
+    """Installs `client` as the shared client for `project_id` (used for tests and benchmarks)."""
+    with _lock:
+        _clients[project_id] = client
+
+
+def reset_bigquery_clients():
+    global _credentials, _storage_client
+    with _lock:
+        for client in _clients.values():
+            close = getattr(client, "close", None)
+            if close is not None:
+                close()
+        _clients.clear()
+        _storage_client = None
+        _credentials = None
@@ -0,0 +1,252 @@
+"""Rate limiting, retries and adaptive concurrency for Gemini and BigQuery calls.
+
+Every model call (per model) and every BigQuery job (per project) goes
+through a limiter with
+
+- an optional token bucket capping the request rate (off unless
+  *_RATE_PER_SECOND is set, e.g. from the project's quota),
+- an AIMD concurrency cap: each success raises the cap by 1/cap (about one
+  slot per cap's worth of calls), each throttle halves it,
+- retries with jittered exponential backoff on 429, 5xx, quota and rate
+  limit errors.
+
+Throttles and retries are added to the current span (summed into the
+Prometheus counters by tracing) and to `get_limit_stats()`.
+"""
+import os
+import random
+import threading
+import time
+
+from tracing import current_span
+
+CALL_MAX_RETRIES = int(os.environ.get("CALL_MAX_RETRIES", 4))
+CALL_BACKOFF_BASE_SECONDS = float(os.environ.get("CALL_BACKOFF_BASE_SECONDS", 0.5))
+CALL_BACKOFF_MAX_SECONDS = float(os.environ.get("CALL_BACKOFF_MAX_SECONDS", 20))
+# Requests per second and burst size of each token bucket, by kind of call. The limiters are
+# shared by every session in the process, so set the rate from the project's quota; 0 (the
+# default) turns the bucket off and leaves the retries and the AIMD cap to handle overload.
+RATE_LIMITS = {
+    "gemini": (float(os.environ.get("GEMINI_RATE_PER_SECOND", 0)), int(os.environ.get("GEMINI_BURST", 20))),
+    "bigquery": (float(os.environ.get("BIGQUERY_RATE_PER_SECOND", 0)), int(os.environ.get("BIGQUERY_BURST", 20))),
+}
+# Upper bound of the adaptive concurrency cap, by kind of call; the cap starts here.
+MAX_CONCURRENCY = {
+    "gemini": int(os.environ.get("GEMINI_MAX_CONCURRENCY", 16)),
+    "bigquery": int(os.environ.get("BIGQUERY_MAX_CONCURRENCY", 16)),
+}
+AIMD_DECREASE_FACTOR = 0.5
+THROTTLE_STATUS_CODES = {429, 503}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# BigQuery reports rate and quota limits as 403s with one of these reasons.
+THROTTLE_REASONS = {"rateLimitExceeded", "quotaExceeded", "RESOURCE_EXHAUSTED"}
+RETRYABLE_REASONS = THROTTLE_REASONS | {"backendError", "internalError", "UNAVAILABLE"}
+
+_lock = threading.Lock()
+_limiters = {}
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available; returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AdaptiveConcurrency:
+    """Concurrency cap that grows additively on success and shrinks multiplicatively on throttling."""
+
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * AIMD_DECREASE_FACTOR)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class Limiter:
+    def __init__(self, kind):
+        rate, burst = RATE_LIMITS[kind]
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.concurrency = AdaptiveConcurrency(MAX_CONCURRENCY[kind])
+        # failures: calls that gave up after running out of retries.
+        self.stats = {"calls": 0, "throttles": 0, "retries": 0, "failures": 0, "queued_seconds": 0.0}
+
+    def acquire(self):
+        started = time.monotonic()
+        if self.bucket is not None:
+            self.bucket.acquire()
+        self.concurrency.acquire()
+        queued = time.monotonic() - started
+        with _lock:
+            self.stats["calls"] += 1
+            self.stats["queued_seconds"] += queued
+        return queued
+
+
+def get_limiter(kind, key):
+    with _lock:
+        limiter = _limiters.get((kind, key))
+        if limiter is None:
+            limiter = _limiters[(kind, key)] = Limiter(kind)
+        return limiter
+
+
+def _status_code(error):
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _reasons(error):
+    return {item.get("reason") for item in getattr(error, "errors", None) or [] if isinstance(item, dict)} | {getattr(error, "status", None)}
+
+
+def is_throttle(error):
+    """True for errors that mean "slow down": 429, 503 and quota or rate limit reasons."""
+    return _status_code(error) in THROTTLE_STATUS_CODES or bool(_reasons(error) & THROTTLE_REASONS)
+
+
+def is_retryable(error):
+    return (
+        _status_code(error) in RETRYABLE_STATUS_CODES
+        or bool(_reasons(error) & RETRYABLE_REASONS)
+        or isinstance(error, (ConnectionError, TimeoutError))
+    )
+
+
+def backoff_seconds(attempt):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(CALL_BACKOFF_MAX_SECONDS, CALL_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def _record(limiter, error, attempt):
+    """Counts a failed attempt; returns (throttled, retry)."""
+    throttled = is_throttle(error)
+    retryable = is_retryable(error)
+    retried = retryable and attempt < CALL_MAX_RETRIES
+    with _lock:
+        if throttled:
+            limiter.stats["throttles"] += 1
+        if retried:
+            limiter.stats["retries"] += 1
+        elif retryable:
+            limiter.stats["failures"] += 1
+    span = current_span()
+    attributes = getattr(span, "attributes", {})
+    span.set(
+        throttles=attributes.get("throttles", 0) + int(throttled),
+        retries=attributes.get("retries", 0) + int(retried),
+    )
+    return throttled, retried
+
+
+def limited_call(kind, key, func, *args, **kwargs):
+    """Calls `func(*args, **kwargs)` under the limiter for (`kind`, `key`), retrying throttled and transient failures.
+
+    `kind` is "gemini" (keyed by model) or "bigquery" (keyed by project).
+    """
+    limiter = get_limiter(kind, key)
+    attempt = 0
+    while True:
+        queued = limiter.acquire()
+        if queued > 0.001:
+            current_span().set(queued_ms=round(queued * 1000, 3))
+        throttled = False
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            throttled, retry = _record(limiter, e, attempt)
+            if not retry:
+                raise
+        finally:
+            limiter.concurrency.release(throttled)
+        time.sleep(backoff_seconds(attempt))
+        attempt += 1
+
+
+def limited_stream(kind, key, start):
+    """Like `limited_call` for a streamed response: `start()` returns an iterator of chunks.
+
+    Nothing is acquired until the first `next()`. Retries apply until the
+    first chunk arrives, which is when throttling errors surface; the
+    concurrency slot is then held until the stream is exhausted or closed.
+    """
+    limiter = get_limiter(kind, key)
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            chunks = iter(start())
+            first = next(chunks, None)
+            break
+        except Exception as e:
+            throttled, retry = _record(limiter, e, attempt)
+            limiter.concurrency.release(throttled)
+            if not retry:
+                raise
+        except BaseException:
+            limiter.concurrency.release()
+            raise
+        time.sleep(backoff_seconds(attempt))
+        attempt += 1
+    throttled = False
+    try:
+        if first is None:
+            return
+        yield first
+        yield from chunks
+    except Exception as e:
+        throttled = is_throttle(e)
+        raise
+    finally:
+        limiter.concurrency.release(throttled)
+
+
+def get_limit_stats():
+    """Per-limiter counters plus the current concurrency cap and calls in flight, keyed "kind:key"."""
+    with _lock:
+        limiters = dict(_limiters)
+    return {
+        f"{kind}:{key}": dict(
+            limiter.stats,
+            concurrency_limit=round(limiter.concurrency.limit, 2),
+            in_flight=limiter.concurrency.in_flight,
+        )
+        for (kind, key), limiter in limiters.items()
+    }
+
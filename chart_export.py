@@ -0,0 +1,55 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+CHART_EXPORT_CACHE_MAX_BYTES = int(os.environ.get("CHART_EXPORT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+EXPORT_FORMATS = {
+    "html": {"mime": "text/html", "extension": "html"},
+    "json": {"mime": "application/json", "extension": "json"},
+}
+
+_lock = threading.Lock()
+_exports = OrderedDict()
+_total_bytes = 0
+
+
+def figure_hash(fig) -> str:
+    return hashlib.sha256(fig.to_json().encode("utf-8")).hexdigest()
+
+
+def _serialize(fig, fmt):
+    import plotly.io as pio
+    if fmt == "html":
+        return pio.to_html(fig, full_html=True, include_plotlyjs='cdn').encode("utf-8")
+    if fmt == "json":
+        # Compact Plotly JSON; loads back with plotly.io.from_json.
+        return pio.to_json(fig, pretty=False, remove_uids=True).encode("utf-8")
+    raise ValueError(f"Unknown chart export format {fmt!r}; expected one of {sorted(EXPORT_FORMATS)}")
+
+
+def export_chart(fig, fmt="html", figure_key=None):
+    """Serializes `fig` on demand, caching the bytes by figure and format.
+
+    `figure_key` must identify the figure's content (the pipeline's
+    `chart_export_key()`); without one the figure JSON is hashed, which
+    costs about as much as the export itself.
+    """
+    global _total_bytes
+    key = (figure_key or figure_hash(fig), fmt)
+    with _lock:
+        payload = _exports.get(key)
+        if payload is not None:
+            _exports.move_to_end(key)
+            return payload
+
+    payload = _serialize(fig, fmt)
+    with _lock:
+        if key not in _exports and len(payload) <= CHART_EXPORT_CACHE_MAX_BYTES:
+            _exports[key] = payload
+            _total_bytes += len(payload)
+            while _total_bytes > CHART_EXPORT_CACHE_MAX_BYTES:
+                _, evicted = _exports.popitem(last=False)
+                _total_bytes -= len(evicted)
+    return payload
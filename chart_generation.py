@@ -1,30 +1,33 @@
-from google import genai
-from google.genai import types
-import plotly.express as px
+from model_client import get_model_client
+from prompts import register_prompt, generate
+from tracing import traced
 import ast 
 import pandas as pd
+from chart_reduction import (
+    BAR_MAX_CATEGORIES, PIE_MAX_SLICES, binned_histogram, downsample_line, reduced_scatter, top_n_with_other,
+)
 
 project_id = "bigquery-public-data"
 model = "gemini-2.0-flash-001"
 
-client = genai.Client(project=project_id, location="global", vertexai=True)
+client = None
 
-def generate_chart_suggestion(df_head: str, df_dtypes: str,user_query: str,insight:str):
-    prompt =f"""
-You are a data visualization expert.
 
-Your task is to recommend the most appropriate chart type for visualizing the given data extracted from a BigQuery query.
+def _is_category_column(series):
+    # Strings are `str` dtype under pandas 3 (and from Arrow results), not only `object`.
+    return (
+        pd.api.types.is_object_dtype(series)
+        or pd.api.types.is_string_dtype(series)
+        or isinstance(series.dtype, pd.CategoricalDtype)
+    )
 
-Use the information below:
 
-1. User Query:
-{user_query}
+CHART_SUGGESTION_PROMPT = register_prompt("chart_suggestion", """
+You are a data visualization expert.
 
-2. Sample Rows (first few rows of the result dataframe):
-{df_head}
+Your task is to recommend the most appropriate chart type for visualizing the given data extracted from a BigQuery query.
 
-3. Column Types (data types for each column):
-{df_dtypes}
+Use the information given after these instructions: the user query, sample rows of the result dataframe and its column types.
 
 ---------------------
 Instructions:
@@ -161,12 +164,26 @@ Rules:
   - X-axis: N/A
   - Y-axis: N/A
 Return only this structured answer. Do not explain or include any comments or justification.
-""" 
+""", """1. User Query:
+{user_query}
 
-    contents = [types.Content(role="user", parts=[types.Part.from_text(text=prompt)])]
-    response = client.models.generate_content(contents=contents, model=model)
+2. Sample Rows (first few rows of the result dataframe):
+{df_head}
+
+3. Column Types (data types for each column):
+{df_dtypes}
+""", max_system_tokens=2200)
+
+
+@traced("chart_suggestion")
+def generate_chart_suggestion(df_head: str, df_dtypes: str,user_query: str,insight:str):
+    response = generate(client or get_model_client(project_id), model, CHART_SUGGESTION_PROMPT, user_query=user_query, df_head=df_head, df_dtypes=df_dtypes)
     return response.text.strip()
+
+
+@traced("chart")
 def generate_chart(df, suggestion):
+    import plotly.express as px
     lines = suggestion.split('\n')
     chart_type, x_col, y_col, values_col, label_col = None, None, None, None, None
 
@@ -191,24 +208,26 @@ def generate_chart(df, suggestion):
     if chart_type in ['bar','scatter'] and x_col in df.columns and y_col in df.columns:
         df_clean = drop_nulls([x_col, y_col])
         if chart_type == 'bar':
+            df_clean = top_n_with_other(df_clean, x_col, y_col, BAR_MAX_CATEGORIES)
             fig = px.bar(df_clean, x=x_col, y=y_col, title=f"{y_col} by {x_col}")
         elif chart_type == 'scatter':
-            fig = px.scatter(df_clean, x=x_col, y=y_col, title=f"{y_col} vs {x_col}")
+            fig = reduced_scatter(df_clean, x_col, y_col, title=f"{y_col} vs {x_col}")
     elif chart_type == 'line':
         df_clean = drop_nulls([x_col, y_col])
         # Check if there's a categorical column for hue (e.g., not x_col or y_col)
         hue_col = None
         for col in df_clean.columns:
-            if col not in [x_col, y_col] and df_clean[col].dtype == 'object':
+            if col not in [x_col, y_col] and _is_category_column(df_clean[col]):
                 hue_col = col
                 break
+        df_clean = downsample_line(df_clean, x_col, y_col, hue_col)
         if hue_col:
             fig = px.line(df_clean, x=x_col, y=y_col, color=hue_col, title=f"{y_col} over {x_col} by {hue_col}")
         else:
             fig = px.line(df_clean, x=x_col, y=y_col, title=f"{y_col} over {x_col}")
     elif chart_type == 'stacked_doughnut':
         # Identify label columns (categorical) and a numeric value column
-        categorical_cols = df.select_dtypes(include='object').columns.tolist()
+        categorical_cols = [col for col in df.columns if _is_category_column(df[col])]
         numeric_cols = df.select_dtypes(include='number').columns.tolist()
 
         if len(categorical_cols) >= 2 and numeric_cols:
@@ -227,11 +246,15 @@ def generate_chart(df, suggestion):
 
     elif chart_type == 'pie' and label_col in df.columns and values_col in df.columns:
         df_clean = drop_nulls([label_col, values_col])
+        df_clean = top_n_with_other(df_clean, label_col, values_col, PIE_MAX_SLICES)
         fig = px.pie(df_clean, names=label_col, values=values_col, title=f"Distribution of {label_col}")
 
     elif chart_type == 'histogram' and values_col in df.columns:
         df_clean = drop_nulls([values_col])
-        fig = px.histogram(df_clean, x=values_col, title=f"Histogram of {values_col}")
+        if pd.api.types.is_numeric_dtype(df_clean[values_col]):
+            fig = binned_histogram(df_clean, values_col, title=f"Histogram of {values_col}")
+        else:
+            fig = px.histogram(df_clean, x=values_col, title=f"Histogram of {values_col}")
 
     elif chart_type in ['bar', 'line'] and x_col.startswith('[') and y_col.startswith('['):
         try:
@@ -0,0 +1,108 @@
+import os
+import re
+import threading
+
+import pandas as pd
+
+# Local recommendations below this confidence fall back to generate_chart_suggestion.
+CHART_RECOMMENDER_MIN_CONFIDENCE = float(os.environ.get("CHART_RECOMMENDER_MIN_CONFIDENCE", 0.75))
+MAX_PIE_SLICES = 6
+MAX_BAR_CATEGORIES = 30
+
+_PROPORTION_WORDS = re.compile(r"\b(share|proportion|percent(age)?|breakdown|split|composition|fraction)\b", re.IGNORECASE)
+_TIME_PART_NAMES = re.compile(r"(^|_)(year|quarter|month|week|day|date|hour|minute)(_|$)", re.IGNORECASE)
+
+_stats_lock = threading.Lock()
+_stats = {"local": 0, "llm_fallback": 0}
+
+
+def _is_datetime(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    return pd.api.types.is_object_dtype(series) and pd.api.types.infer_dtype(series, skipna=True) in ("date", "datetime")
+
+
+def _is_categorical(series):
+    return (
+        isinstance(series.dtype, pd.CategoricalDtype)
+        or pd.api.types.is_bool_dtype(series)
+        or pd.api.types.is_string_dtype(series)
+        or pd.api.types.is_object_dtype(series)
+    )
+
+
+def _format(chart_type, x="N/A", y="N/A", values="N/A", labels="N/A"):
+    return f"Chart type: {chart_type}\nX-axis: {x}\nY-axis: {y}\nValues: {values}\nLabels: {labels}"
+
+
+def recommend_chart(df, user_query=""):
+    """Picks a chart from column dtypes and cardinality alone.
+
+    Returns (suggestion, confidence), where suggestion has the same
+    "Chart type: / X-axis: / Y-axis: / Values: / Labels:" layout that
+    generate_chart_suggestion produces and generate_chart parses.
+    """
+    if df.empty:
+        return "VISUALISATION NOT NEEDED", 1.0
+
+    datetimes = [column for column in df.columns if _is_datetime(df[column])]
+    numerics = [column for column in df.columns if column not in datetimes and pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column])]
+    categoricals = [column for column in df.columns if column not in datetimes and column not in numerics and _is_categorical(df[column])]
+    rows = len(df)
+
+    # A single number needs no chart.
+    if rows == 1 and len(df.columns) == 1:
+        return "VISUALISATION NOT NEEDED", 0.95
+
+    # One row of several measures: compare the measures side by side.
+    if rows == 1 and len(numerics) >= 2 and not categoricals and not datetimes:
+        x_values = [str(column) for column in numerics]
+        y_values = [float(df[column].iloc[0]) for column in numerics]
+        return _format("bar", x=repr(x_values), y=repr(y_values)), 0.8
+
+    # Time column plus a measure: trend.
+    if len(datetimes) == 1 and numerics and len(categoricals) <= 1:
+        return _format("line", x=datetimes[0], y=numerics[0]), 0.9
+
+    # Integer time parts (year, month, hour...) plus a measure also read as a trend.
+    time_parts = [column for column in numerics if _TIME_PART_NAMES.search(str(column))]
+    measures = [column for column in numerics if column not in time_parts]
+    if not datetimes and len(time_parts) == 1 and len(measures) == 1 and len(categoricals) <= 1:
+        return _format("line", x=time_parts[0], y=measures[0]), 0.8
+
+    # One category and one measure: bar, or pie for a small share-of-whole question.
+    if len(categoricals) == 1 and len(numerics) == 1 and not datetimes:
+        category, measure = categoricals[0], numerics[0]
+        if rows <= MAX_PIE_SLICES and _PROPORTION_WORDS.search(user_query or "") and (df[measure] >= 0).all():
+            return _format("pie", values=measure, labels=category), 0.85
+        if rows <= MAX_BAR_CATEGORIES:
+            return _format("bar", x=category, y=measure), 0.85
+        return _format("bar", x=category, y=measure), 0.6
+
+    # Several categories and a measure: hierarchical breakdown.
+    if len(categoricals) >= 2 and len(numerics) == 1 and not datetimes:
+        labels = "[" + ", ".join(str(column) for column in categoricals[:3]) + "]"
+        return _format("stacked_doughnut", values=numerics[0], labels=labels), 0.8
+
+    # A single measure over many rows: distribution.
+    if len(numerics) == 1 and len(df.columns) == 1:
+        return _format("histogram", values=numerics[0]), 0.85
+
+    # Two measures: probably a relationship, but the LLM can judge intent better.
+    if len(numerics) == 2 and not categoricals and not datetimes:
+        return _format("scatter", x=numerics[0], y=numerics[1]), 0.6
+
+    return None, 0.0
+
+
+def record_recommendation(used_local: bool):
+    with _stats_lock:
+        _stats["local" if used_local else "llm_fallback"] += 1
+
+
+def get_recommender_stats():
+    with _stats_lock:
+        local = _stats["local"]
+        fallback = _stats["llm_fallback"]
+    total = local + fallback
+    return {"local": local, "llm_fallback": fallback, "fallback_rate": fallback / total if total else 0.0}
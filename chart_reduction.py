@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Point budgets applied before a figure is built, so the browser payload stays
+# small no matter how many rows the query returned.
+LINE_MAX_POINTS = int(os.environ.get("CHART_LINE_MAX_POINTS", 2000))
+SCATTER_WEBGL_ROWS = int(os.environ.get("CHART_SCATTER_WEBGL_ROWS", 5000))
+SCATTER_DENSITY_ROWS = int(os.environ.get("CHART_SCATTER_DENSITY_ROWS", 50000))
+SCATTER_DENSITY_BINS = int(os.environ.get("CHART_SCATTER_DENSITY_BINS", 100))
+HISTOGRAM_MAX_BINS = int(os.environ.get("CHART_HISTOGRAM_MAX_BINS", 100))
+BAR_MAX_CATEGORIES = int(os.environ.get("CHART_BAR_MAX_CATEGORIES", 30))
+PIE_MAX_SLICES = int(os.environ.get("CHART_PIE_MAX_SLICES", 10))
+OTHER_LABEL = "Other"
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling; returns the indices of the points to keep.
+
+    `x` must be numeric and sorted ascending. The first and last points are
+    always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        keep[i + 1] = previous
+    return keep
+
+
+def _as_numeric(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.astype("int64").to_numpy()
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=float)
+    return np.arange(len(series), dtype=float)
+
+
+def downsample_line(df, x_col, y_col, hue_col=None, max_points=LINE_MAX_POINTS):
+    """LTTB-downsamples each line (per `hue_col` group) to about `max_points` points in total."""
+    if len(df) <= max_points or not pd.api.types.is_numeric_dtype(df[y_col]):
+        return df
+    groups = [df] if hue_col is None else [group for _, group in df.groupby(hue_col, sort=False)]
+    per_group = max(max_points // len(groups), 3)
+    reduced = []
+    for group in groups:
+        group = group.sort_values(x_col, kind="stable") if pd.api.types.is_numeric_dtype(group[x_col]) or pd.api.types.is_datetime64_any_dtype(group[x_col]) else group
+        keep = lttb_indices(_as_numeric(group[x_col]), group[y_col].to_numpy(dtype=float), per_group)
+        reduced.append(group.iloc[keep])
+    return pd.concat(reduced)
+
+
+def top_n_with_other(df, label_col, value_col, max_categories):
+    """Sums `value_col` per label and folds everything past the top `max_categories` into "Other"."""
+    if df[label_col].nunique() <= max_categories or not pd.api.types.is_numeric_dtype(df[value_col]):
+        return df
+    totals = df.groupby(label_col, sort=False)[value_col].sum().sort_values(ascending=False)
+    top = totals.iloc[:max_categories - 1]
+    other = totals.iloc[max_categories - 1:].sum()
+    reduced = pd.DataFrame({label_col: top.index.astype(str), value_col: top.to_numpy()})
+    return pd.concat([reduced, pd.DataFrame({label_col: [OTHER_LABEL], value_col: [other]})], ignore_index=True)
+
+
+def binned_histogram(df, values_col, title, max_bins=HISTOGRAM_MAX_BINS):
+    """Bins with NumPy on the server and draws the bins as bars, so only bin counts are sent."""
+    values = df[values_col].to_numpy(dtype=float)
+    values = values[np.isfinite(values)]
+    bin_edges = np.histogram_bin_edges(values, bins="auto")
+    if len(bin_edges) - 1 > max_bins:
+        bin_edges = np.histogram_bin_edges(values, bins=max_bins)
+    counts, bin_edges = np.histogram(values, bins=bin_edges)
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Bar(
+        x=(bin_edges[:-1] + bin_edges[1:]) / 2,
+        y=counts,
+        width=np.diff(bin_edges),
+        marker_line_width=0,
+    ))
+    fig.update_layout(title=title, xaxis_title=values_col, yaxis_title="count", bargap=0)
+    return fig
+
+
+def reduced_scatter(df, x_col, y_col, title):
+    """Scatter that switches to WebGL past SCATTER_WEBGL_ROWS and to a pre-binned density heatmap past SCATTER_DENSITY_ROWS."""
+    import plotly.express as px
+    import plotly.graph_objects as go
+    numeric = pd.api.types.is_numeric_dtype(df[x_col]) and pd.api.types.is_numeric_dtype(df[y_col])
+    if len(df) > SCATTER_DENSITY_ROWS and numeric:
+        counts, x_edges, y_edges = np.histogram2d(
+            df[x_col].to_numpy(dtype=float), df[y_col].to_numpy(dtype=float), bins=SCATTER_DENSITY_BINS
+        )
+        fig = go.Figure(go.Heatmap(
+            x=(x_edges[:-1] + x_edges[1:]) / 2,
+            y=(y_edges[:-1] + y_edges[1:]) / 2,
+            z=np.where(counts.T > 0, counts.T, np.nan),
+            colorscale="Viridis",
+            colorbar_title="rows",
+        ))
+        fig.update_layout(title=f"{title} (density of {len(df):,} rows)", xaxis_title=x_col, yaxis_title=y_col)
+        return fig
+    render_mode = "webgl" if len(df) > SCATTER_WEBGL_ROWS else "auto"
+    return px.scatter(df, x=x_col, y=y_col, title=title, render_mode=render_mode)
@@ -0,0 +1,30 @@
+import time
+
+from tracing import start_span, record_llm_usage
+
+
+def timed_stream(name, chunks):
+    """Wraps a `generate_content_stream` response, yielding chunk text and recording time-to-first-token."""
+    return _iter_timed(name, chunks, time.perf_counter())
+
+
+def _iter_timed(name, chunks, start):
+    first_token_at = None
+    stream_span = start_span(name, streamed=True)
+    try:
+        for chunk in chunks:
+            # The last chunk carries the usage totals for the whole response.
+            record_llm_usage(chunk, stream_span)
+            text = chunk.text
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                stream_span.set(ttft_ms=round((first_token_at - start) * 1000, 3))
+            yield text
+    except Exception as e:
+        stream_span.end(e)
+        raise
+    finally:
+        stream_span.end()
+
@@ -0,0 +1,320 @@
+"""Local DuckDB execution over a Parquet snapshot of the 311 table.
+
+    python local_engine.py sync [--max-rows N]      # refresh the snapshot from BigQuery
+    python local_engine.py synthetic [--rows N]     # write a synthetic snapshot (offline)
+    python local_engine.py query "SELECT ..."       # run BigQuery SQL on the snapshot
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+project_id = "bigquery-public-data"
+dataset_id = "san_francisco_311"
+table_name = "311_service_requests"
+TABLE_ID = f"{project_id}.{dataset_id}.{table_name}"
+
+SNAPSHOT_DIR = os.environ.get("LOCAL_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".local_snapshot"))
+# "bigquery" always runs remotely, "local" always on the snapshot, "auto" picks per query.
+QUERY_ENGINE = os.environ.get("QUERY_ENGINE", "bigquery")
+QUERY_ENGINES = ("bigquery", "local", "auto")
+# In auto mode a snapshot older than this is not used.
+LOCAL_SNAPSHOT_MAX_AGE_SECONDS = float(os.environ.get("LOCAL_SNAPSHOT_MAX_AGE_SECONDS", 7 * 24 * 3600))
+# Queries relative to "now" (CURRENT_DATE() etc.) need a snapshot at most this old in auto mode.
+LOCAL_RELATIVE_TIME_MAX_AGE_SECONDS = float(os.environ.get("LOCAL_RELATIVE_TIME_MAX_AGE_SECONDS", 24 * 3600))
+
+_RELATIVE_TIME = re.compile(r"\bCURRENT_(DATE|TIMESTAMP|DATETIME|TIME)\b", re.IGNORECASE)
+
+_lock = threading.Lock()
+_connection = None
+# BigQuery table id -> (DuckDB view name, Parquet path)
+_local_tables = {}
+
+
+def snapshot_path():
+    return os.path.join(SNAPSHOT_DIR, f"{table_name}.parquet")
+
+
+def _metadata_path():
+    return os.path.join(SNAPSHOT_DIR, "snapshot.json")
+
+
+def get_snapshot_metadata():
+    """Returns the snapshot's metadata dict, or None if there is no snapshot."""
+    if not os.path.exists(snapshot_path()) or not os.path.exists(_metadata_path()):
+        return None
+    with open(_metadata_path()) as f:
+        return json.load(f)
+
+
+def snapshot_age_seconds():
+    metadata = get_snapshot_metadata()
+    if metadata is None:
+        return None
+    return time.time() - metadata["synced_at"]
+
+
+def _write_metadata(source, rows, **extra):
+    with open(_metadata_path(), "w") as f:
+        json.dump({"source": source, "rows": rows, "synced_at": time.time(), **extra}, f, indent=2, default=str)
+
+
+def register_local_table(bigquery_table_id, view_name, parquet_path):
+    """Makes `bigquery_table_id` resolvable in local queries as a view over `parquet_path`."""
+    with _lock:
+        _local_tables[bigquery_table_id] = (view_name, parquet_path)
+        if _connection is not None:
+            _create_view(_connection, view_name, parquet_path)
+
+
+def _create_view(connection, view_name, parquet_path):
+    connection.execute(f"CREATE OR REPLACE VIEW {view_name} AS SELECT * FROM read_parquet('{parquet_path}')")
+
+
+def _get_connection():
+    global _connection
+    with _lock:
+        if _connection is None:
+            import duckdb
+            _connection = duckdb.connect(database=":memory:")
+            # BigQuery evaluates EXTRACT, DATE() and truncation in UTC by default.
+            _connection.execute("SET TimeZone = 'UTC'")
+            for view_name, parquet_path in _local_tables.values():
+                if os.path.exists(parquet_path):
+                    _create_view(_connection, view_name, parquet_path)
+        return _connection
+
+
+def reset_connection():
+    """Drops the DuckDB connection so views are recreated over rewritten Parquet files."""
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+        _connection = None
+
+
+register_local_table(TABLE_ID, "sf311_service_requests", snapshot_path())
+
+
+def transpile_to_duckdb(sql_query):
+    """Rewrites BigQuery SQL for DuckDB, pointing known BigQuery tables at their local views.
+
+    Raises ValueError when the query reads a table that has no local copy or
+    cannot be transpiled.
+    """
+    try:
+        tree = sqlglot.parse_one(sql_query, read="bigquery")
+    except SqlglotError as e:
+        raise ValueError(f"cannot parse query: {e}") from e
+    cte_names = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+    for table in tree.find_all(exp.Table):
+        table_id = ".".join(part for part in (table.catalog, table.db, table.name) if part)
+        if not table.db and table.name in cte_names:
+            continue
+        if table_id not in _local_tables:
+            raise ValueError(f"no local copy of table {table_id}")
+        table.set("catalog", None)
+        table.set("db", None)
+        table.set("this", exp.to_identifier(_local_tables[table_id][0]))
+    try:
+        return tree.sql(dialect="duckdb")
+    except SqlglotError as e:
+        raise ValueError(f"cannot transpile query: {e}") from e
+
+
+def choose_engine(sql_query, engine=None):
+    """Returns "local" or "bigquery" for `sql_query` under the QUERY_ENGINE policy."""
+    engine = engine or QUERY_ENGINE
+    if engine not in QUERY_ENGINES:
+        raise ValueError(f"Unknown query engine {engine!r}; expected one of {QUERY_ENGINES}")
+    if engine != "auto":
+        return engine
+    age = snapshot_age_seconds()
+    if age is None or age > LOCAL_SNAPSHOT_MAX_AGE_SECONDS:
+        return "bigquery"
+    if _RELATIVE_TIME.search(sql_query) and age > LOCAL_RELATIVE_TIME_MAX_AGE_SECONDS:
+        return "bigquery"
+    try:
+        transpile_to_duckdb(sql_query)
+    except ValueError:
+        return "bigquery"
+    return "local"
+
+
+def run_local_query(sql_query):
+    """Runs BigQuery-dialect SQL on the local snapshot and returns a pyarrow Table."""
+    duckdb_sql = transpile_to_duckdb(sql_query)
+    cursor = _get_connection().cursor()
+    try:
+        return cursor.execute(duckdb_sql).to_arrow_table()
+    finally:
+        cursor.close()
+
+
+def snapshot_schema_text():
+    """Schema text in the `get_bigquery_table_schema_text()` format, read from the snapshot file."""
+    type_names = {
+        pa.types.is_string: "STRING",
+        pa.types.is_large_string: "STRING",
+        pa.types.is_timestamp: "TIMESTAMP",
+        pa.types.is_date: "DATE",
+        pa.types.is_floating: "FLOAT",
+        pa.types.is_integer: "INTEGER",
+        pa.types.is_boolean: "BOOLEAN",
+    }
+    schema_text = f"Table: {table_name}\n"
+    for field in pq.read_schema(snapshot_path()):
+        field_type = next((name for check, name in type_names.items() if check(field.type)), "STRING")
+        schema_text += f"    - {field.name} ({field_type})\n"
+    return schema_text
+
+
+def snapshot_sample_rows(limit=10):
+    rows = pq.ParquetFile(snapshot_path()).read_row_group(0).slice(0, limit).to_pylist()
+    return json.dumps(rows, indent=2, default=str)
+
+
+def sync_snapshot(max_rows=None):
+    """Copies the BigQuery table into the Parquet snapshot, streaming it batch by batch."""
+    from bigquery_client import get_bigquery_client, get_bigquery_storage_client
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    client = get_bigquery_client(project_id)
+    table = client.get_table(TABLE_ID)
+    rows = client.list_rows(table, max_results=max_rows)
+    tmp_path = snapshot_path() + ".tmp"
+    written = 0
+    writer = None
+    try:
+        for batch in rows.to_arrow_iterable(bqstorage_client=None if max_rows else get_bigquery_storage_client()):
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, batch.schema, compression="zstd")
+            writer.write_batch(batch)
+            written += batch.num_rows
+        if writer is None:
+            # An empty table (or max_rows=0) streams no batches; keep the columns in an empty snapshot.
+            empty = client.list_rows(table, max_results=0).to_arrow(create_bqstorage_client=False)
+            pq.write_table(empty, tmp_path, compression="zstd")
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, snapshot_path())
+    _write_metadata("bigquery", written, source_modified=table.modified)
+    reset_connection()
+    return written
+
+
+def synthetic_table(rows, seed=0):
+    """A table with the 311 schema and plausible value distributions, for offline use."""
+    rng = np.random.default_rng(seed)
+
+    def pick(values, p=None):
+        return np.asarray(values, dtype=object)[rng.choice(len(values), rows, p=p)]
+
+    neighborhoods = ["Mission", "Tenderloin", "South of Market", "Bayview Hunters Point", "Castro/Upper Market",
+                     "Outer Sunset", "Inner Richmond", "Nob Hill", "Potrero Hill", "Excelsior", "Noe Valley", "Marina"]
+    subtypes = {
+        "Street and Sidewalk Cleaning": ["Bulky Items", "General Cleaning", "Human or Animal Waste", "Encampment Cleanup"],
+        "Graffiti": ["Graffiti on Public Property", "Graffiti on Private Property"],
+        "Street Defects": ["Pothole", "Sidewalk Defect", "Street Defect"],
+        "Noise Report": ["Noise - Construction", "Noise - Amplified Sound"],
+        "Abandoned Vehicle": ["Abandoned Vehicle - Car", "Abandoned Vehicle - Truck"],
+        "Sewer Issues": ["Sewer Backup", "Catch Basin Clogged"],
+    }
+    agencies = {
+        "Street and Sidewalk Cleaning": "DPW Ops Queue",
+        "Graffiti": "DPW Graffiti Queue",
+        "Street Defects": "DPW BSM Queue",
+        "Noise Report": "Entertainment Commission",
+        "Abandoned Vehicle": "SFMTA Abandoned Vehicles Work Queue",
+        "Sewer Issues": "PUC Sewer Ops",
+    }
+    service_names = list(subtypes)
+    service_index = rng.choice(len(service_names), rows, p=[0.4, 0.2, 0.12, 0.08, 0.12, 0.08])
+    service_name = np.asarray(service_names, dtype=object)[service_index]
+    service_subtype = np.empty(rows, dtype=object)
+    for i, name in enumerate(service_names):
+        mask = service_index == i
+        service_subtype[mask] = pick(subtypes[name])[mask]
+    agency = np.asarray([agencies[name] for name in service_names], dtype=object)[service_index]
+
+    start = np.datetime64("2008-07-01T00:00:00", "s")
+    span = int((np.datetime64("2025-06-30T00:00:00", "s") - start).astype(int))
+    created = start + np.sort(rng.integers(0, span, rows)).astype("timedelta64[s]")
+    resolution = (rng.exponential(3 * 86400, rows)).astype("timedelta64[s]")
+    closed_mask = rng.random(rows) < 0.93
+    closed = np.where(closed_mask, created + resolution, np.datetime64("NaT"))
+    lat = rng.normal(37.76, 0.025, rows)
+    lon = rng.normal(-122.44, 0.03, rows)
+    streets = [f"{name} ST" for name in ("MISSION", "MARKET", "VALENCIA", "FOLSOM", "HOWARD", "GEARY", "TARAVAL", "IRVING")]
+    street = pick(streets)
+
+    def ts(values):
+        return pa.array(values.astype("datetime64[us]"), type=pa.timestamp("us", tz="UTC"))
+
+    return pa.table({
+        "service_request_id": pa.array((np.arange(rows) + 1_000_000).astype(str)),
+        "status": pa.array(np.where(closed_mask, "Closed", "Open").astype(object)),
+        "status_notes": pa.array(pick(["Case Resolved", "Case Transferred", "Duplicate", "Open"])),
+        "agency_responsible": pa.array(agency),
+        "service_name": pa.array(service_name),
+        "service_subtype": pa.array(service_subtype),
+        "requested_datetime": ts(created),
+        "updated_datetime": ts(np.where(closed_mask, closed, created)),
+        "expected_datetime": ts(created + np.timedelta64(7 * 86400, "s")),
+        "closed_date": ts(closed),
+        "address": pa.array([f"{n} {s}" for n, s in zip(rng.integers(1, 3000, rows), street)]),
+        "street": pa.array(street),
+        "supervisor_district": pa.array(rng.integers(1, 12, rows).astype(str)),
+        "neighborhood": pa.array(pick(neighborhoods)),
+        "point": pa.array([f"POINT({x:.6f} {y:.6f})" for x, y in zip(lon, lat)]),
+        "source": pa.array(pick(["Phone", "Mobile/Open311", "Web", "Integrated Agency"], p=[0.35, 0.4, 0.15, 0.1])),
+        "media_url": pa.array(np.full(rows, None, dtype=object), type=pa.string()),
+        "lat": pa.array(lat),
+        "long": pa.array(lon),
+        "created_at": ts(created),
+        "closed_at": ts(closed),
+    })
+
+
+def write_synthetic_snapshot(rows=200_000, seed=0):
+    """Writes a synthetic snapshot so the local engine works without GCP access."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    pq.write_table(synthetic_table(rows, seed), snapshot_path(), compression="zstd", row_group_size=100_000)
+    _write_metadata("synthetic", rows, seed=seed)
+    reset_connection()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    sync_parser = commands.add_parser("sync", help="refresh the snapshot from BigQuery")
+    sync_parser.add_argument("--max-rows", type=int, default=None)
+    synthetic_parser = commands.add_parser("synthetic", help="write a synthetic snapshot")
+    synthetic_parser.add_argument("--rows", type=int, default=200_000)
+    synthetic_parser.add_argument("--seed", type=int, default=0)
+    query_parser = commands.add_parser("query", help="run BigQuery SQL on the snapshot")
+    query_parser.add_argument("sql")
+    args = parser.parse_args()
+
+    if args.command == "sync":
+        print(f"Synced {sync_snapshot(args.max_rows)} rows to {snapshot_path()}")
+    elif args.command == "synthetic":
+        print(f"Wrote {write_synthetic_snapshot(args.rows, args.seed)} synthetic rows to {snapshot_path()}")
+    else:
+        print(run_local_query(args.sql).to_pandas().to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import threading
+
+MODEL_LOCATION = "global"
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def get_model_client(project_id):
+    """Returns the process-wide Vertex AI `genai.Client` for `project_id`, creating it on first use.
+
+    google-genai is imported here rather than at module import, so the app
+    starts without loading it and without credentials. A module's own
+    `client` attribute, when set (the benchmarks install fakes there), is
+    used instead.
+    """
+    with _lock:
+        client = _clients.get(project_id)
+        if client is None:
+            from google import genai
+            client = genai.Client(project=project_id, location=MODEL_LOCATION, vertexai=True)
+            _clients[project_id] = client
+        return client
+
@@ -0,0 +1,423 @@
+import contextvars
+import hashlib
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from chart_generation import generate_chart_suggestion, generate_chart
+from chart_recommender import recommend_chart, record_recommendation, CHART_RECOMMENDER_MIN_CONFIDENCE
+from insights_generation import insights, insights_stream
+from local_engine import choose_engine, get_snapshot_metadata
+from query_execution import run_query_to_arrow, stream_query_in_bigquery, QueryResult
+from query_fast_path import fast_generate_sql
+from query_scanning import get_query_cost_estimate, check_query_budget
+from query_simplifier import simplify_query, simplify_query_stream, partial_simplified_query
+from query_verification import verify_query
+from result_profiling import profile_result_json
+from result_cache import get_cached_result, put_cached_result, sql_hash
+from rollups import rewrite_for_rollups
+import single_flight
+from sql_cache import cache_key, get_cached_sql, put_cached_sql, normalize_question
+from sql_generation import generate_sql
+from sql_validator import validate_sql, record_validation
+
+# "accurate" runs simplify, generate and verify as three model calls;
+# "fast" fuses them into one schema-constrained call (see query_fast_path).
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "accurate")
+PIPELINE_MODES = ("accurate", "fast")
+
+# Worker threads shared by all sessions for the independent post-query stages
+# (insights and the chart branch). 1 runs them one after another.
+POST_QUERY_WORKERS = int(os.environ.get("POST_QUERY_WORKERS", 4))
+
+# Fetch query results page by page and show the first page while the rest loads.
+STREAM_QUERY_RESULTS = os.environ.get("STREAM_QUERY_RESULTS", "1") == "1"
+
+# Stream insight and simplified-question text into the page as it is generated.
+STREAM_LLM_OUTPUT = os.environ.get("STREAM_LLM_OUTPUT", "1") == "1"
+
+_executor = ThreadPoolExecutor(max_workers=POST_QUERY_WORKERS) if POST_QUERY_WORKERS > 1 else None
+_DONE = object()
+
+
+class Stage:
+    """A named pipeline step computed from the values of its `inputs`.
+
+    Inputs name either other stages or plain values set on the pipeline with
+    `set_inputs`. Memoized stages are only recomputed when the fingerprint of
+    their inputs changes; `memoize=False` stages (rendering) run every time.
+    """
+
+    def __init__(self, name, inputs, func, memoize=True):
+        self.name = name
+        self.inputs = list(inputs)
+        self.func = func
+        self.memoize = memoize
+
+
+class Pipeline:
+    def __init__(self, stages, state=None):
+        self.stages = {stage.name: stage for stage in stages}
+        # name -> (input key, output); pass st.session_state storage to keep memos across reruns.
+        self.state = {} if state is None else state
+        self.values = {}
+
+    def set_inputs(self, **values):
+        self.values.update(values)
+
+    def key(self, name):
+        """Fingerprint of everything `name` depends on, computed without running any stage."""
+        stage = self.stages.get(name)
+        if stage is None:
+            raw = repr(("value", name, self.values.get(name)))
+        else:
+            raw = repr((name, [self.key(input_name) for input_name in stage.inputs]))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def is_fresh(self, name):
+        entry = self.state.get(name)
+        return entry is not None and entry[0] == self.key(name)
+
+    def get(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            return self.values[name]
+        key = self.key(name)
+        entry = self.state.get(name)
+        if stage.memoize and entry is not None and entry[0] == key:
+            return entry[1]
+        args = [self.get(input_name) for input_name in stage.inputs]
+        output = stage.func(*args)
+        if stage.memoize:
+            self.state[name] = (key, output)
+        return output
+
+    def iter_stages(self, names, executor=None):
+        """Computes `names`, yielding (name, output) as each one finishes.
+
+        With an executor the stages run concurrently, so their shared upstream
+        stages must already be fresh; without one they run in order.
+        """
+        if executor is None:
+            for name in names:
+                yield name, self.get(name)
+            return
+        # Each task runs in a copy of the caller's context, so its spans join the caller's trace.
+        futures = {executor.submit(contextvars.copy_context().run, self.get, name): name for name in names}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def submit(self, name, executor):
+        """Starts computing `name` on `executor`; returns None when there is no executor."""
+        if executor is None:
+            return None
+        return executor.submit(contextvars.copy_context().run, self.get, name)
+
+    def prime(self, name, output):
+        """Stores `output` as the memoized value of `name` for the current inputs."""
+        self.state[name] = (self.key(name), output)
+
+
+def _verify(question, sql_query, schema, llm_only=False):
+    if not sql_query:
+        return ""
+    # The LLM verifier is a full model round-trip; skip it when the local check proves the query fine.
+    if not llm_only and validate_sql(sql_query, schema)["valid"]:
+        record_validation(llm_skipped=True)
+        return sql_query
+    record_validation(llm_skipped=False)
+    correct_query = verify_query(question, sql_query, schema)
+    response = json.loads(correct_query)
+    return response.get("correct_query", sql_query)
+
+
+def _fused_simplified(fused):
+    return json.dumps({"simplified_user_query": fused.get("simplified_user_query", "")})
+
+
+def _fused_generated(fused):
+    return fused.get("sql_query", "")
+
+
+def _fused_verify(question, fused, schema):
+    # When the model's own check failed, go straight to the LLM verifier.
+    self_check_passed = fused.get("self_check", {}).get("passed", True)
+    return _verify(question, fused.get("sql_query", ""), schema, llm_only=not self_check_passed)
+
+
+def _shared(namespace, key, func, on_report, *args):
+    """`single_flight.do` for `func(report, *args)`; each value passed to `report` goes to `on_report`.
+
+    With `on_report` (a UI callback), the shared computation runs on a helper
+    thread and `on_report` runs here, in the caller's thread, so a Streamlit
+    rerun raised by the page never passes through the flight. Without it,
+    `report` is None and everything runs in this thread.
+    """
+    if on_report is None:
+        return single_flight.do(namespace, key, func, None, *args)
+    reports = queue.Queue()
+    outcome = {}
+
+    def run():
+        try:
+            outcome["value"] = single_flight.do(namespace, key, func, reports.put, *args)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            reports.put(_DONE)
+
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+    while (value := reports.get()) is not _DONE:
+        on_report(value)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
+
+
+def _estimate(verified_sql, project_id, engine):
+    # Local queries scan the snapshot; there is nothing billed to estimate.
+    if engine == "local":
+        return None
+    estimated_bytes, _ = single_flight.do("estimate", (project_id, sql_hash(verified_sql)), get_query_cost_estimate, verified_sql, project_id)
+    return estimated_bytes
+
+
+def _result_cache_sql(verified_sql, engine):
+    if engine != "local":
+        return verified_sql
+    # Keep snapshot results apart from BigQuery ones, and from older snapshots.
+    synced_at = (get_snapshot_metadata() or {}).get("synced_at")
+    return f"-- local snapshot {synced_at}\n{verified_sql}"
+
+
+def _execute(verified_sql, engine, estimated_bytes, project_id, username, run_id, on_progress=None):
+    cache_sql = _result_cache_sql(verified_sql, engine)
+    cached_result = get_cached_result(cache_sql)
+    if cached_result is not None:
+        return dict(cached_result, from_cache=True, engine=engine)
+    maximum_bytes_billed = None
+    if engine != "local":
+        # Raises QueryBudgetExceeded before anything is submitted.
+        maximum_bytes_billed = check_query_budget(estimated_bytes, username)
+    # Sessions running the same SQL at the same time share one job.
+    entry, shared = _shared(
+        "query", sql_hash(cache_sql), _run_query, on_progress,
+        verified_sql, engine, cache_sql, maximum_bytes_billed, project_id, username,
+    )
+    return dict(entry, from_cache=False, shared=shared, engine=engine)
+
+
+def _run_query(report, verified_sql, engine, cache_sql, maximum_bytes_billed, project_id, username):
+    if engine == "local":
+        return put_cached_result(cache_sql, QueryResult(run_query_to_arrow(project_id, verified_sql, engine="local")))
+    truncated = False
+    if STREAM_QUERY_RESULTS:
+        streaming_result = stream_query_in_bigquery(project_id, verified_sql, maximum_bytes_billed=maximum_bytes_billed, username=username)
+        if report is not None:
+            report(streaming_result)
+        table = streaming_result.to_arrow()
+        truncated = streaming_result.truncated
+    else:
+        table = run_query_to_arrow(project_id, verified_sql, maximum_bytes_billed=maximum_bytes_billed, username=username)
+    return put_cached_result(cache_sql, QueryResult(table), truncated=truncated)
+
+
+def _insight_payload(query_result, executed_sql):
+    # A bounded summary of every row instead of the first rows verbatim.
+    return profile_result_json(query_result.to_pandas(), executed_sql)
+
+
+def _insights(question, result, executed_sql):
+    query_result = result["result"]
+    if query_result.empty:
+        return None
+    question_key = normalize_question(question)
+    insight = result["insights"].get(question_key)
+    if insight is None:
+        insight = insights(question, _insight_payload(query_result, executed_sql))
+        result["insights"][question_key] = insight
+    return insight
+
+
+def _chart_suggestion(question, result, insight):
+    query_result = result["result"]
+    if query_result.empty:
+        return None
+    question_key = normalize_question(question)
+    suggestion = result["chart_suggestions"].get(question_key)
+    if suggestion is None:
+        df = query_result.to_pandas()
+        # Dtype rules settle most charts; the LLM only sees the low-confidence cases.
+        suggestion, confidence = recommend_chart(df, question)
+        used_local = suggestion is not None and confidence >= CHART_RECOMMENDER_MIN_CONFIDENCE
+        record_recommendation(used_local)
+        if not used_local:
+            df_head = df.head(25).to_string()
+            df_dtypes = str(df.dtypes)
+            suggestion = generate_chart_suggestion(df_head, df_dtypes, question, insight or "")
+        result["chart_suggestions"][question_key] = suggestion
+    return suggestion
+
+
+def _chart_suggestion_without_insight(question, result):
+    # Lets the chart branch run alongside the insights call instead of after it.
+    return _chart_suggestion(question, result, None)
+
+
+def _chart(result, suggestion):
+    if not suggestion:
+        return None
+    fig = generate_chart(result["result"].to_pandas(), suggestion)
+    if fig:
+        fig.update_layout(template="plotly")
+    return fig
+
+
+class QueryPipeline(Pipeline):
+    """The NL -> SQL -> result -> insight -> chart flow behind the SQL Generator page.
+
+    Values: question, schema, project_id, username (whose byte budget is
+    charged) and run_id (bumped on every "Run This Query" click so execution
+    is re-checked against the result cache). The "engine" stage applies the
+    QUERY_ENGINE policy, so a query may run on the local DuckDB snapshot
+    instead of BigQuery, and the "rewrite" stage points COUNT queries at a
+    pre-aggregated rollup table when one can answer them (see rollups).
+    `mode` selects the "accurate" three-call or "fast" single-call SQL path and
+    defaults to the PIPELINE_MODE setting. With an `executor` (the shared
+    POST_QUERY_WORKERS pool by default) the chart suggestion no longer waits
+    for the insight text, so `post_query_stages()` can run both branches at once.
+    `render(pipeline, result)` is called on every rerun once the query ran.
+    """
+
+    def __init__(self, state=None, render=None, mode=None, executor=_executor):
+        mode = mode or PIPELINE_MODE
+        self.executor = executor
+        # Called with the StreamingResult while a query's pages are loading.
+        self.on_progress = None
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode {mode!r}; expected one of {PIPELINE_MODES}")
+        if mode == "fast":
+            stages = [
+                Stage("fused", ["question", "schema"], fast_generate_sql),
+                Stage("simplify", ["fused"], _fused_simplified),
+                Stage("generate", ["fused"], _fused_generated),
+                Stage("verify", ["question", "fused", "schema"], _fused_verify),
+            ]
+        else:
+            stages = [
+                Stage("simplify", ["question", "schema"], simplify_query),
+                Stage("generate", ["simplify"], generate_sql),
+                Stage("verify", ["question", "generate", "schema"], _verify),
+            ]
+        if executor is not None:
+            chart_suggestion_stage = Stage("chart_suggestion", ["question", "execute"], _chart_suggestion_without_insight)
+        else:
+            chart_suggestion_stage = Stage("chart_suggestion", ["question", "execute", "insights"], _chart_suggestion)
+        stages += [
+            Stage("engine", ["verify"], choose_engine),
+            Stage("rewrite", ["verify", "engine"], rewrite_for_rollups),
+            Stage("estimate", ["rewrite", "project_id", "engine"], _estimate),
+            Stage("execute", ["rewrite", "engine", "estimate", "project_id", "username", "run_id"], self._execute),
+            Stage("insights", ["question", "execute", "rewrite"], _insights),
+            chart_suggestion_stage,
+            Stage("chart", ["execute", "chart_suggestion"], _chart),
+        ]
+        if render is not None:
+            stages.append(Stage("render", ["execute"], lambda result: render(self, result), memoize=False))
+        super().__init__(stages, state)
+
+    def _execute(self, *args):
+        return _execute(*args, on_progress=self.on_progress)
+
+    def resolve_sql(self, on_simplified=None):
+        """Returns the verified SQL, serving it from the persistent SQL cache when possible.
+
+        `on_simplified` is called with the partially generated simplified
+        question while it streams in (accurate mode only).
+        """
+        if self.is_fresh("verify"):
+            return self.get("verify")
+        question = self.values["question"]
+        schema = self.values["schema"]
+        cached = get_cached_sql(question, schema)
+        if cached:
+            self._prime_sql(cached)
+            self.state["sql_from_cache"] = True
+            return cached["verified_sql"]
+        # Sessions asking the same question at the same time share one set of model calls.
+        resolved, shared = _shared("sql", cache_key(question, schema), self._resolve_uncached_sql, on_simplified)
+        if shared:
+            self._prime_sql(resolved)
+        self.state["sql_from_cache"] = False
+        self.state["sql_shared"] = shared
+        return resolved["verified_sql"]
+
+    def _resolve_uncached_sql(self, report):
+        if report is not None:
+            for partial in self.stream_simplify():
+                report(partial)
+        resolved = {
+            "simplified_question": self.get("simplify"),
+            "generated_sql": self.get("generate"),
+            "verified_sql": self.get("verify"),
+        }
+        put_cached_sql(self.values["question"], self.values["schema"], **resolved)
+        return resolved
+
+    def _prime_sql(self, resolved):
+        self.prime("simplify", resolved["simplified_question"])
+        self.prime("generate", resolved["generated_sql"])
+        self.prime("verify", resolved["verified_sql"])
+
+    def stream_simplify(self):
+        """Yields the simplified question as it streams in and memoizes the full response."""
+        if self.is_fresh("simplify") or self.stages["simplify"].func is not simplify_query:
+            return
+        parts = []
+        for text in simplify_query_stream(self.values["question"], self.values["schema"]):
+            parts.append(text)
+            yield partial_simplified_query("".join(parts))
+        self.prime("simplify", "".join(parts))
+
+    def stream_insights(self):
+        """Yields insight text chunks as they stream in and memoizes the full text.
+
+        A memoized or cached insight is yielded as a single chunk.
+        """
+        if self.is_fresh("insights"):
+            yield self.get("insights") or ""
+            return
+        result = self.get("execute")
+        question = self.values["question"]
+        question_key = normalize_question(question)
+        insight = result["insights"].get(question_key)
+        if insight is None and not result["result"].empty:
+            parts = []
+            for text in insights_stream(question, _insight_payload(result["result"], self.get("rewrite"))):
+                parts.append(text)
+                yield text
+            insight = "".join(parts)
+            result["insights"][question_key] = insight
+        elif insight is not None:
+            yield insight
+        self.prime("insights", insight)
+
+    def post_query_stages(self):
+        """Yields ("insights", text) and ("chart", figure) in completion order."""
+        self.get("execute")
+        return self.iter_stages(["insights", "chart"], self.executor)
+
+    def chart_export_key(self):
+        """Identifies the chart by the result it was drawn from and its suggestion, without serializing the figure."""
+        result = self.get("execute")
+        raw = repr((result["sql_hash"], result["created_at"], self.get("chart_suggestion")))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def sql_from_cache(self):
+        return self.state.get("sql_from_cache", False)
+
+    def sql_shared(self):
+        """True when the SQL came from another session's identical in-flight question."""
+        return self.state.get("sql_shared", False)
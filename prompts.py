@@ -0,0 +1,178 @@
+"""Registry of the Gemini prompts, split into a static system prefix and a per-request part.
+
+The static prefix of each prompt (instructions, rules, column reference,
+examples) is rendered once and sent as the system instruction, so every
+call starts with the same tokens; the question, SQL and data go last in
+the user turn. With PROMPT_CONTEXT_CACHE on, prefixes large enough for
+Vertex context caching are uploaded once with `client.caches.create` and
+referenced by name until they expire. `python prompts.py check` fails
+when a static prefix grows past its budget.
+"""
+import math
+import os
+import sys
+import threading
+import time
+
+from call_limits import limited_call, limited_stream
+from tracing import record_llm_usage, current_span
+
+# Upload large static prefixes as Vertex cached contents ("1" to enable).
+PROMPT_CONTEXT_CACHE = os.environ.get("PROMPT_CONTEXT_CACHE", "0") == "1"
+# Vertex rejects cached contents below a model-dependent minimum; smaller prefixes are sent inline.
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", 1024))
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", 3600))
+# After a failed cache upload, the prefix is sent inline for this long before trying again.
+CONTEXT_CACHE_RETRY_SECONDS = int(os.environ.get("CONTEXT_CACHE_RETRY_SECONDS", 600))
+# Rough characters per token for offline estimates; Gemini averages about 4 on English, less on SQL.
+CHARS_PER_TOKEN = 3.5
+# Modules that register prompts, imported by the budget check.
+PROMPT_MODULES = (
+    "query_simplifier", "sql_generation", "query_verification", "query_fast_path",
+    "insights_generation", "chart_generation",
+)
+
+COLUMN_DESCRIPTIONS = """**Column Descriptions (from bigquery-public-data.san_francisco_311.311_service_requests)**:
+- service_request_id (STRING): Unique identifier for the request
+- status (STRING): Current status of the request (e.g., open, closed)
+- status_notes (STRING): Additional status details
+- agency_responsible (STRING): Department handling the request
+- service_name (STRING): Type of city service requested
+- service_subtype (STRING): More specific category of the request
+- requested_datetime (TIMESTAMP): Time when the request was created
+- updated_datetime (TIMESTAMP): Last update timestamp
+- expected_datetime (TIMESTAMP): Expected resolution date
+- closed_date (TIMESTAMP): When the request was marked as closed
+- address (STRING): Request location
+- street (STRING): Street name
+- supervisor_district (STRING): Supervisor district of the address
+- neighborhood (STRING): Neighborhood in San Francisco
+- point (GEOGRAPHY): Geographical coordinates
+- source (STRING): How the request was submitted (e.g., mobile app, phone)
+- media_url (STRING): Link to media related to the request
+- lat (FLOAT64): Latitude
+- long (FLOAT64): Longitude
+- created_at (TIMESTAMP): When the record was added
+- closed_at (TIMESTAMP): When the request was closed (duplicate of closed_date)"""
+
+# Stand-ins for prefix values that come from BigQuery at runtime, used by the budget check.
+EXAMPLE_PREFIX_VALUES = {
+    "schema": "Table: 311_service_requests\n" + "".join(
+        f"    - {line[2:].split(' (')[0]} ({line.split('(')[1].split(')')[0]})\n"
+        for line in COLUMN_DESCRIPTIONS.splitlines()[1:]
+    ),
+}
+
+_lock = threading.Lock()
+_registry = {}
+_context_caches = {}
+
+
+class Prompt:
+    def __init__(self, name, system, request, max_system_tokens, prefix_fields=()):
+        self.name = name
+        self.system = system
+        self.request = request
+        self.max_system_tokens = max_system_tokens
+        self.prefix_fields = tuple(prefix_fields)
+        self._rendered = {}
+
+    def system_text(self, **prefix_values):
+        """The static prefix; fields such as the schema change rarely, so each rendering is kept."""
+        key = tuple(prefix_values.get(field, "") for field in self.prefix_fields)
+        text = self._rendered.get(key)
+        if text is None:
+            text = self.system.format(**dict(zip(self.prefix_fields, key))) if self.prefix_fields else self.system
+            self._rendered[key] = text
+        return text
+
+    def request_text(self, **values):
+        return self.request.format(**values)
+
+
+def register_prompt(name, system, request, max_system_tokens, prefix_fields=()):
+    """Registers a prompt; `system` is formatted only with `prefix_fields`, `request` with the per-call values."""
+    prompt = Prompt(name, system, request, max_system_tokens, prefix_fields)
+    with _lock:
+        _registry[name] = prompt
+    return prompt
+
+
+def get_prompt(name):
+    return _registry[name]
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def generate(client, model, prompt, config=None, prefix_values=None, stream=False, **values):
+    """Calls `generate_content` (or `generate_content_stream`) with the prompt's prefix and per-request part."""
+    from google.genai import types
+    system_text = prompt.system_text(**(prefix_values or {}))
+    contents = [{"role": "user", "parts": [{"text": prompt.request_text(**values)}]}]
+    config = config or types.GenerateContentConfig()
+    cache_name = _context_cache_name(client, model, prompt, system_text)
+    if cache_name:
+        config = config.model_copy(update={"cached_content": cache_name, "system_instruction": None})
+    else:
+        config = config.model_copy(update={"system_instruction": system_text})
+    current_span().set(prompt=prompt.name, context_cached=bool(cache_name))
+    if stream:
+        return limited_stream("gemini", model, lambda: client.models.generate_content_stream(model=model, contents=contents, config=config))
+    response = limited_call("gemini", model, client.models.generate_content, model=model, contents=contents, config=config)
+    record_llm_usage(response)
+    return response
+
+
+def _context_cache_name(client, model, prompt, system_text):
+    if not PROMPT_CONTEXT_CACHE or estimate_tokens(system_text) < CONTEXT_CACHE_MIN_TOKENS:
+        return None
+    key = (model, system_text)
+    now = time.time()
+    with _lock:
+        cached = _context_caches.get(key)
+    if cached is not None and cached["expires_at"] > now:
+        return cached["name"]
+    try:
+        from google.genai import types
+        cache = client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name=f"nlsql-{prompt.name}",
+                system_instruction=system_text,
+                ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s",
+            ),
+        )
+        # Stop using the cache a minute early so no call references an expired one.
+        entry = {"name": cache.name, "expires_at": now + CONTEXT_CACHE_TTL_SECONDS - 60}
+    except Exception as e:
+        print(f"Context cache unavailable for prompt {prompt.name}, sending it inline: {e}")
+        entry = {"name": None, "expires_at": now + CONTEXT_CACHE_RETRY_SECONDS}
+    with _lock:
+        _context_caches[key] = entry
+    return entry["name"]
+
+
+def check_budgets():
+    """Returns (name, estimated tokens, budget) for every registered prompt whose static prefix is over budget."""
+    for module in PROMPT_MODULES:
+        __import__(module)
+    over = []
+    for name, prompt in sorted(_registry.items()):
+        tokens = estimate_tokens(prompt.system_text(**EXAMPLE_PREFIX_VALUES))
+        print(f"{name:<18} {tokens:>6} / {prompt.max_system_tokens} tokens")
+        if tokens > prompt.max_system_tokens:
+            over.append((name, tokens, prompt.max_system_tokens))
+    return over
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["check"]:
+        sys.exit("usage: python prompts.py check")
+    # The prompt modules register with the importable `prompts`, not with this `__main__` copy.
+    import prompts
+    over_budget = prompts.check_budgets()
+    for name, tokens, budget in over_budget:
+        print(f"Prompt {name} is over budget: about {tokens} tokens, limit {budget}")
+    sys.exit(1 if over_budget else 0)
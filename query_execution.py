@@ -0,0 +1,198 @@
+import contextvars
+import os
+import threading
+
+import pyarrow as pa
+
+from bigquery_client import get_bigquery_client, get_bigquery_storage_client
+from call_limits import limited_call
+from local_engine import choose_engine, run_local_query
+from query_scanning import record_bytes_billed, bytes_to_human_readable, QueryBudgetExceeded
+from tracing import traced, span, current_span, record_query_job
+
+# Rows fetched per page when streaming results, and the cap on rows kept per query.
+RESULT_PAGE_SIZE = int(os.environ.get("RESULT_PAGE_SIZE", 5000))
+RESULT_MAX_ROWS = int(os.environ.get("RESULT_MAX_ROWS", 200000))
+# Read result pages through the BigQuery Storage API when the library is installed.
+USE_BQ_STORAGE_API = os.environ.get("USE_BQ_STORAGE_API", "1") == "1"
+
+
+def _is_bytes_billed_limit(error):
+    return any(isinstance(item, dict) and item.get("reason") == "bytesBilledLimitExceeded" for item in getattr(error, "errors", None) or [])
+
+
+def _submit_and_wait(client, query, job_config, page_size=None):
+    # Rate-limit errors can surface at submission or when the job finishes; both are retried together.
+    try:
+        query_job = client.query(query, job_config=job_config)
+        return query_job, query_job.result(page_size=page_size)
+    except Exception as e:
+        # The dry-run estimate was under the cap but the job billed more.
+        if _is_bytes_billed_limit(e):
+            raise QueryBudgetExceeded(
+                f"This query would bill more than the {bytes_to_human_readable(job_config.maximum_bytes_billed)} "
+                "left in your query budget."
+            ) from e
+        raise
+
+
+@traced("query_job")
+def run_query_in_bigquery(project_id, query, maximum_bytes_billed=None, username=None, engine=None):
+    """Runs `query` and returns a DataFrame.
+
+    `engine` ("bigquery", "local" or "auto") overrides the QUERY_ENGINE
+    policy; "local" runs the query on the DuckDB snapshot (see local_engine).
+    """
+    if choose_engine(query, engine) == "local":
+        current_span().set(engine="local")
+        return run_local_query(query).to_pandas()
+    client = get_bigquery_client(project_id)
+    from google.cloud import bigquery
+    job_config = bigquery.QueryJobConfig(maximum_bytes_billed=maximum_bytes_billed)
+    query_job, result = limited_call("bigquery", project_id, _submit_and_wait, client, query, job_config)
+    df = result.to_dataframe()
+    record_query_job(query_job)
+    # df = df.dropna(inplace=True)
+    if username is not None:
+        record_bytes_billed(username, query_job.total_bytes_billed)
+    return df
+
+
+@traced("query_job")
+def run_query_to_arrow(project_id, query, maximum_bytes_billed=None, username=None, engine=None):
+    """Like `run_query_in_bigquery` but returns the result as a pyarrow Table, skipping the pandas conversion."""
+    if choose_engine(query, engine) == "local":
+        current_span().set(engine="local")
+        return run_local_query(query)
+    client = get_bigquery_client(project_id)
+    from google.cloud import bigquery
+    job_config = bigquery.QueryJobConfig(maximum_bytes_billed=maximum_bytes_billed)
+    query_job, result = limited_call("bigquery", project_id, _submit_and_wait, client, query, job_config)
+    bqstorage_client = get_bigquery_storage_client() if USE_BQ_STORAGE_API else None
+    table = result.to_arrow(bqstorage_client=bqstorage_client)
+    record_query_job(query_job)
+    if username is not None:
+        record_bytes_billed(username, query_job.total_bytes_billed)
+    return table
+
+
+class QueryResult:
+    """One Arrow buffer shared by the table display, the insight payload and the chart input.
+
+    Rows with nulls are dropped once up front. Slices are zero-copy views and
+    the pandas frame for charting is converted once, lazily.
+    """
+
+    def __init__(self, table):
+        self.table = table.drop_null() if table.num_columns else table
+        self._df = None
+
+    @property
+    def num_rows(self):
+        return self.table.num_rows
+
+    @property
+    def empty(self):
+        return self.table.num_rows == 0
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def head(self, n):
+        return self.table.slice(0, n)
+
+    def to_pandas(self):
+        if self._df is None:
+            # split_blocks keeps null-free numeric columns as views over the Arrow buffers.
+            self._df = self.table.to_pandas(split_blocks=True)
+        return self._df
+
+
+class StreamingResult:
+    """Query result pages loaded on a background thread.
+
+    `batches` grows as Arrow record batches arrive; `wait_for_first_page()`
+    returns as soon as the first one is in and `to_arrow()` blocks until
+    loading finished.
+    """
+
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self.batches = []
+        self.rows_loaded = 0
+        self.total_rows = None
+        self.truncated = False
+        self.error = None
+        self.first_page = threading.Event()
+        self.done = threading.Event()
+
+    def progress(self):
+        expected = min(self.total_rows or self.max_rows, self.max_rows)
+        return min(self.rows_loaded / expected, 1.0) if expected else 1.0
+
+    def wait_for_first_page(self, timeout=None):
+        self.first_page.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return pa.Table.from_batches(self.batches[:1]) if self.batches else pa.table({})
+
+    def to_arrow(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        # Chunked table over the fetched batches; no concatenation copy.
+        return pa.Table.from_batches(self.batches) if self.batches else pa.table({})
+
+
+def _load_pages(project_id, client, query, job_config, streaming_result, username):
+    with span("query_job", streamed=True) as job_span:
+        _load_pages_traced(project_id, client, query, job_config, streaming_result, username, job_span)
+
+
+def _load_pages_traced(project_id, client, query, job_config, streaming_result, username, job_span):
+    try:
+        # The limiter slot is held until the job finishes and its first page is ready.
+        query_job, rows = limited_call("bigquery", project_id, _submit_and_wait, client, query, job_config, RESULT_PAGE_SIZE)
+        streaming_result.total_rows = rows.total_rows
+        bqstorage_client = get_bigquery_storage_client() if USE_BQ_STORAGE_API else None
+        for batch in rows.to_arrow_iterable(bqstorage_client=bqstorage_client):
+            remaining = streaming_result.max_rows - streaming_result.rows_loaded
+            if batch.num_rows > remaining:
+                batch = batch.slice(0, remaining)
+            streaming_result.batches.append(batch)
+            streaming_result.rows_loaded += batch.num_rows
+            streaming_result.first_page.set()
+            if streaming_result.rows_loaded >= streaming_result.max_rows:
+                break
+        streaming_result.truncated = (rows.total_rows or 0) > streaming_result.rows_loaded
+        record_query_job(query_job, job_span)
+        job_span.set(rows=streaming_result.rows_loaded)
+        if username is not None:
+            record_bytes_billed(username, query_job.total_bytes_billed)
+    except Exception as e:
+        streaming_result.error = e
+        job_span.error = f"{type(e).__name__}: {e}"
+    finally:
+        streaming_result.first_page.set()
+        streaming_result.done.set()
+
+
+def stream_query_in_bigquery(project_id, query, maximum_bytes_billed=None, username=None, max_rows=None):
+    """Submits `query` in the background and returns a StreamingResult that fills in page by page.
+
+    Submission errors, including QueryBudgetExceeded, are raised by the
+    StreamingResult's `wait_for_first_page()` and `to_arrow()`.
+    """
+    client = get_bigquery_client(project_id)
+    from google.cloud import bigquery
+    job_config = bigquery.QueryJobConfig(maximum_bytes_billed=maximum_bytes_billed)
+    streaming_result = StreamingResult(max_rows or RESULT_MAX_ROWS)
+    # The copied context keeps the background span in the caller's trace.
+    thread = threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(_load_pages, project_id, client, query, job_config, streaming_result, username),
+        daemon=True,
+    )
+    thread.start()
+    return streaming_result
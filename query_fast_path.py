@@ -0,0 +1,88 @@
+import functools
+from model_client import get_model_client
+from prompts import register_prompt, generate
+from tracing import traced
+import json
+
+project_id = "bigquery-public-data"
+model = "gemini-2.0-flash-001"
+
+client = None
+
+
+@functools.lru_cache(maxsize=None)
+def generate_content_config():
+    from google.genai import types
+    response_schema = types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "simplified_user_query": types.Schema(type=types.Type.STRING),
+            "sql_query": types.Schema(type=types.Type.STRING),
+            "self_check": types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "passed": types.Schema(type=types.Type.BOOLEAN),
+                    "issues": types.Schema(type=types.Type.STRING),
+                },
+                required=["passed", "issues"],
+            ),
+        },
+        required=["simplified_user_query", "sql_query", "self_check"],
+        property_ordering=["simplified_user_query", "sql_query", "self_check"],
+    )
+    return types.GenerateContentConfig(
+        temperature = 0,
+        top_p = 1,
+        seed = 0,
+        max_output_tokens = 8000,
+        safety_settings = [types.SafetySetting(
+          category="HARM_CATEGORY_HATE_SPEECH",
+          threshold="OFF"
+        ),types.SafetySetting(
+          category="HARM_CATEGORY_DANGEROUS_CONTENT",
+          threshold="OFF"
+        ),types.SafetySetting(
+          category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
+          threshold="OFF"
+        ),types.SafetySetting(
+          category="HARM_CATEGORY_HARASSMENT",
+          threshold="OFF"
+        )],
+        response_mime_type = "application/json",
+        response_schema = response_schema,
+    )
+
+
+FUSED_PROMPT = register_prompt("fused", """You are a BigQuery SQL expert working on the dataset:
+`bigquery-public-data.san_francisco_311.311_service_requests`
+
+Schema:
+{schema}
+
+Do the following three steps and return all three results together.
+
+1. **Simplify** the user's question into a concise, unambiguous analytical request (count, compare, retrieve, trend) with its filters and time range. Do not use column names in the simplified question.
+2. **Generate** one syntactically correct BigQuery SQL query answering it.
+   - Use `created_at` for request time filtering and `closed_date` for resolution time.
+   - Use `service_subtype` or `service_name` for request types (potholes, graffiti, noise, ...).
+   - Use `neighborhood`, `agency_responsible`, `status` and `source` as needed.
+   - Include `LIMIT 100` unless the user specifies otherwise.
+   - Use only columns that exist in the schema; never invent fields.
+   - Do not add `IS NOT NULL` filters unless they are needed for a correct aggregation.
+3. **Self-check** the query against the schema and BigQuery syntax. If you find a problem, fix it in `sql_query` and describe what was wrong in `issues`. Set `passed` to false only if the query may still be wrong.
+""", """User Query:
+{user_query}
+""", max_system_tokens=600, prefix_fields=("schema",))
+
+
+@traced("fused")
+def fast_generate_sql(user_query: str, schema: str):
+    """Simplifies, generates and self-checks the SQL for `user_query` in a single model call.
+
+    Returns a dict with `simplified_user_query`, `sql_query` and `self_check`
+    (`passed`, `issues`).
+    """
+    response = generate(client or get_model_client(project_id), model, FUSED_PROMPT, generate_content_config(), prefix_values={"schema": schema}, user_query=user_query)
+    result = json.loads(response.text)
+    result["sql_query"] = result.get("sql_query", "").replace("```sql", "").replace("```", "").strip()
+    return result
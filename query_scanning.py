@@ -1,26 +1,128 @@
-from google.cloud import bigquery
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
 
+from bigquery_client import get_bigquery_client
+from call_limits import limited_call
+from tracing import traced, current_span
+
+DRY_RUN_CACHE_TTL_SECONDS = float(os.environ.get("DRY_RUN_CACHE_TTL_SECONDS", 3600))
+DRY_RUN_CACHE_MAX_ENTRIES = int(os.environ.get("DRY_RUN_CACHE_MAX_ENTRIES", 1000))
+
+# Byte budgets; 0 disables a limit. The per-user budget is a rolling 24h window.
+MAX_BYTES_PER_QUERY = int(os.environ.get("MAX_BYTES_PER_QUERY", 20 * 1024 ** 3))
+MAX_BYTES_PER_USER = int(os.environ.get("MAX_BYTES_PER_USER", 200 * 1024 ** 3))
+USER_BUDGET_WINDOW_SECONDS = 24 * 3600
+
+_lock = threading.Lock()
+_dry_runs = OrderedDict()
+_user_usage = {}
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a query would exceed the per-query or per-user byte budget."""
+
+
+def _sql_hash(query_sql: str) -> str:
+    return hashlib.sha256(query_sql.strip().encode("utf-8")).hexdigest()
+
+
+@traced("dry_run")
 def get_query_cost_estimate(query_sql: str, project_id: str) -> float:
-    client = bigquery.Client(project=project_id)
+    key = (project_id, _sql_hash(query_sql))
+    with _lock:
+        cached = _dry_runs.get(key)
+        if cached is not None and time.time() - cached[0] < DRY_RUN_CACHE_TTL_SECONDS:
+            _dry_runs.move_to_end(key)
+            current_span().set(from_cache=True, bytes_estimated=cached[1])
+            return cached[1]
+
+    from google.cloud import bigquery
+
     job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
 
     try:
-        query_job = client.query(query_sql, job_config=job_config)
+        client = get_bigquery_client(project_id)
+        query_job = limited_call("bigquery", project_id, client.query, query_sql, job_config=job_config)
         if query_job.errors:
             print(f"Dry run failed with errors: {query_job.errors}")
             return None
-        return query_job.total_bytes_processed
+        estimated_bytes = query_job.total_bytes_processed
+        current_span().set(from_cache=False, bytes_estimated=estimated_bytes)
     except Exception as e:
         print(f"An error occurred during dry run: {e}")
         return None
 
+    with _lock:
+        _dry_runs[key] = (time.time(), estimated_bytes)
+        _dry_runs.move_to_end(key)
+        while len(_dry_runs) > DRY_RUN_CACHE_MAX_ENTRIES:
+            _dry_runs.popitem(last=False)
+    return estimated_bytes
+
+
+def _prune_usage(username, now):
+    usage = [entry for entry in _user_usage.get(username, []) if now - entry[0] < USER_BUDGET_WINDOW_SECONDS]
+    _user_usage[username] = usage
+    return usage
+
+
+def get_user_bytes_used(username: str) -> int:
+    with _lock:
+        return sum(bytes_billed for _, bytes_billed in _prune_usage(username, time.time()))
+
+
+def record_bytes_billed(username: str, bytes_billed: int):
+    if not bytes_billed:
+        return
+    with _lock:
+        _prune_usage(username, time.time()).append((time.time(), int(bytes_billed)))
+
+
+def get_maximum_bytes_billed(username: str):
+    """Returns the `maximum_bytes_billed` cap for the next job of `username`, or None if unlimited."""
+    limits = []
+    if MAX_BYTES_PER_QUERY:
+        limits.append(MAX_BYTES_PER_QUERY)
+    if MAX_BYTES_PER_USER:
+        limits.append(max(MAX_BYTES_PER_USER - get_user_bytes_used(username), 0))
+    return min(limits) if limits else None
+
+
+def check_query_budget(estimated_bytes, username: str):
+    """Refuses a query before submission when its dry-run estimate is over budget.
+
+    Returns the `maximum_bytes_billed` to apply to the real job.
+    """
+    maximum_bytes_billed = get_maximum_bytes_billed(username)
+    if maximum_bytes_billed is None:
+        return None
+    if maximum_bytes_billed <= 0:
+        raise QueryBudgetExceeded("Your daily query budget is used up.")
+    if estimated_bytes is None:
+        return maximum_bytes_billed
+    if MAX_BYTES_PER_QUERY and estimated_bytes > MAX_BYTES_PER_QUERY:
+        raise QueryBudgetExceeded(
+            f"This query would process {bytes_to_human_readable(estimated_bytes)}, "
+            f"over the per-query limit of {bytes_to_human_readable(MAX_BYTES_PER_QUERY)}."
+        )
+    if estimated_bytes > maximum_bytes_billed:
+        raise QueryBudgetExceeded(
+            f"This query would process {bytes_to_human_readable(estimated_bytes)}, but only "
+            f"{bytes_to_human_readable(maximum_bytes_billed)} of your daily budget is left."
+        )
+    return maximum_bytes_billed
+
+
 def bytes_to_human_readable(bytes_value: int) -> str:
     """Converts bytes to a human-readable format (KB, MB, GB, TB)."""
     if bytes_value is None:
         return "N/A"
-    
+
     for unit in ['bytes', 'KB', 'MB', 'GB', 'TB']:
         if bytes_value < 1024.0:
             return f"{bytes_value:.2f} {unit}"
         bytes_value /= 1024.0
-    return f"{bytes_value:.2f} PB"  
+    return f"{bytes_value:.2f} PB"
@@ -1,36 +1,43 @@
-from google import genai
-from google.genai import types
+import functools
+from llm_streaming import timed_stream
+from model_client import get_model_client
+from prompts import register_prompt, generate
+from tracing import traced
+import re
 
 project_id = "bigquery-public-data"
 model = "gemini-2.0-flash-001" 
 # model= "gemini-2.5-pro-preview-06-05"
 
-client = genai.Client(project=project_id, location="global", vertexai=True)
-
-generate_content_config = types.GenerateContentConfig(
-    temperature = 0,
-    top_p = 1,
-    seed = 0,
-    max_output_tokens = 1000,
-    safety_settings = [types.SafetySetting(
-      category="HARM_CATEGORY_HATE_SPEECH",
-      threshold="OFF"
-    ),types.SafetySetting(
-      category="HARM_CATEGORY_DANGEROUS_CONTENT",
-      threshold="OFF"
-    ),types.SafetySetting(
-      category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-      threshold="OFF"
-    ),types.SafetySetting(
-      category="HARM_CATEGORY_HARASSMENT",
-      threshold="OFF"
-    )],
-    response_mime_type = "application/json"
-  )
+client = None
+
+
+@functools.lru_cache(maxsize=None)
+def generate_content_config():
+    from google.genai import types
+    return types.GenerateContentConfig(
+        temperature = 0,
+        top_p = 1,
+        seed = 0,
+        max_output_tokens = 1000,
+        safety_settings = [types.SafetySetting(
+          category="HARM_CATEGORY_HATE_SPEECH",
+          threshold="OFF"
+        ),types.SafetySetting(
+          category="HARM_CATEGORY_DANGEROUS_CONTENT",
+          threshold="OFF"
+        ),types.SafetySetting(
+          category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
+          threshold="OFF"
+        ),types.SafetySetting(
+          category="HARM_CATEGORY_HARASSMENT",
+          threshold="OFF"
+        )],
+        response_mime_type = "application/json"
+    )
 
 
-def simplify_query(user_query: str, schema: str):
-    instruction = f"""You are a Query Simplifier. Your task is to take a natural language user query and convert it into a concise, unambiguous version suitable for generating SQL.
+SIMPLIFY_PROMPT = register_prompt("simplify", """You are a Query Simplifier. Your task is to take a natural language user query and convert it into a concise, unambiguous version suitable for generating SQL.
 
 Follow these steps:
 
@@ -40,9 +47,6 @@ Follow these steps:
 4. Translate the natural phrasing into a format that uses **clear and analytical language**.
 5. Ensure the final query is **complete, logical, and easily translatable to SQL**.
 
-User Query:
-{user_query}
-
 You have access to this dataset:
 `bigquery-public-data.san_francisco_311.311_service_requests`
 
@@ -67,20 +71,30 @@ Input: "List agencies with the longest average resolution time"
 → simplified_user_query: "Find agencies ranked by average time taken to resolve service requests"
 
 Return result as:
-{{"simplified_user_query": "final-simplified-query"}}
-"""
-
-    full_prompt = instruction + "\n\n simplify the user query."
-    contents = [ 
-    {
-        "role": "user",
-        "parts": [{"text": full_prompt}]
-    }]
-    response = client.models.generate_content(
-        contents=contents,
-        model=model,
-        config=generate_content_config
-    )
+{"simplified_user_query": "final-simplified-query"}
+""", """User Query:
+{user_query}
+
+simplify the user query.""", max_system_tokens=600)
+
+
+@traced("simplify")
+def simplify_query(user_query: str, schema: str):
+    response = generate(client or get_model_client(project_id), model, SIMPLIFY_PROMPT, generate_content_config(), user_query=user_query)
     response_text = response.text
     print(response_text)
     return response_text
+
+
+def simplify_query_stream(user_query: str, schema: str):
+    """Yields the raw JSON response of `simplify_query` in chunks as the model generates it."""
+    chunks = generate(client or get_model_client(project_id), model, SIMPLIFY_PROMPT, generate_content_config(), stream=True, user_query=user_query)
+    return timed_stream("simplify", chunks)
+
+
+def partial_simplified_query(response_text: str) -> str:
+    """Extracts the (possibly incomplete) simplified question from a partial JSON response."""
+    match = re.search(r'"simplified_user_query"\s*:\s*"((?:[^"\\]|\\.)*)', response_text)
+    if not match:
+        return ""
+    return match.group(1).replace('\\"', '"')
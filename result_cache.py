@@ -0,0 +1,86 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Results older than this are treated as stale and re-executed.
+RESULT_CACHE_MAX_AGE_SECONDS = float(os.environ.get("RESULT_CACHE_MAX_AGE_SECONDS", 15 * 60))
+# Upper bound on the in-memory size of all cached results.
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_total_bytes = 0
+
+
+def sql_hash(sql: str) -> str:
+    return hashlib.sha256(sql.strip().encode("utf-8")).hexdigest()
+
+
+def _result_size(result):
+    nbytes = getattr(result, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes)
+    return int(result.memory_usage(deep=True).sum())
+
+
+def _drop(key):
+    global _total_bytes
+    entry = _entries.pop(key, None)
+    if entry is not None:
+        _total_bytes -= entry["size_bytes"]
+
+
+def get_cached_result(sql: str):
+    """Returns the cache entry for `sql` with its current `age_seconds`, or None if missing or stale."""
+    key = sql_hash(sql)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        age = time.time() - entry["created_at"]
+        if age > RESULT_CACHE_MAX_AGE_SECONDS:
+            _drop(key)
+            return None
+        _entries.move_to_end(key)
+        entry["age_seconds"] = age
+        return entry
+
+
+def put_cached_result(sql: str, result, truncated=False):
+    """Caches `result` (a QueryResult or DataFrame) under the hash of `sql` and returns the new entry."""
+    global _total_bytes
+    key = sql_hash(sql)
+    size = _result_size(result)
+    entry = {
+        "result": result,
+        "sql_hash": key,
+        "created_at": time.time(),
+        "age_seconds": 0.0,
+        "size_bytes": size,
+        "truncated": truncated,
+        "insights": {},
+        "chart_suggestions": {},
+    }
+    with _lock:
+        _drop(key)
+        if size > RESULT_CACHE_MAX_BYTES:
+            return entry
+        _entries[key] = entry
+        _total_bytes += size
+        while _total_bytes > RESULT_CACHE_MAX_BYTES and _entries:
+            _drop(next(iter(_entries)))
+    return entry
+
+
+def get_cache_stats():
+    with _lock:
+        return {"entries": len(_entries), "total_bytes": _total_bytes}
+
+
+def clear_cache():
+    global _total_bytes
+    with _lock:
+        _entries.clear()
+        _total_bytes = 0
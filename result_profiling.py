@@ -0,0 +1,179 @@
+import datetime as dt
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+# Bounds on the summary sent to the model, so its size does not grow with the result.
+PROFILE_MAX_COLUMNS = int(os.environ.get("PROFILE_MAX_COLUMNS", 25))
+PROFILE_TOP_K = int(os.environ.get("PROFILE_TOP_K", 10))
+PROFILE_MAX_TIME_BUCKETS = int(os.environ.get("PROFILE_MAX_TIME_BUCKETS", 24))
+PROFILE_MAX_CORRELATIONS = int(os.environ.get("PROFILE_MAX_CORRELATIONS", 10))
+PROFILE_SAMPLE_ROWS = int(os.environ.get("PROFILE_SAMPLE_ROWS", 10))
+PROFILE_MAX_VALUE_CHARS = 80
+
+_BUCKETS = [("D", "day"), ("W", "week"), ("M", "month"), ("Q", "quarter"), ("Y", "year")]
+# Wrappers that keep a COUNT or SUM additive, e.g. the rollup rewrite's CAST(COALESCE(SUM(...), 0) AS INT64).
+_ADDITIVE_WRAPPERS = (exp.Alias, exp.Cast, exp.Paren, exp.Coalesce, exp.Round)
+
+
+def _short(value):
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), 4)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    text = str(value)
+    return text if len(text) <= PROFILE_MAX_VALUE_CHARS else text[:PROFILE_MAX_VALUE_CHARS] + "..."
+
+
+def additive_columns(sql_query):
+    """Names of the output columns of `sql_query` that are COUNTs or SUMs, so their values can be totalled."""
+    try:
+        tree = sqlglot.parse_one(sql_query or "", read="bigquery")
+    except SqlglotError:
+        return set()
+    if not isinstance(tree, exp.Select):
+        return set()
+    columns = set()
+    anonymous = 0
+    for expression in tree.expressions:
+        if isinstance(expression, (exp.Alias, exp.Column)):
+            name = expression.alias_or_name
+        else:
+            # BigQuery names unaliased expressions f0_, f1_, ...
+            name = f"f{anonymous}_"
+            anonymous += 1
+        node = expression
+        while isinstance(node, _ADDITIVE_WRAPPERS):
+            node = node.this
+        if isinstance(node, (exp.Count, exp.Sum)):
+            columns.add(name)
+    return columns
+
+
+def _numeric_stats(series):
+    stats = series.describe(percentiles=[0.25, 0.5, 0.75])
+    return {
+        "type": "numeric",
+        "count": int(stats["count"]),
+        "sum": _short(series.sum()),
+        "mean": _short(stats["mean"]),
+        "std": _short(stats["std"]) if not pd.isna(stats["std"]) else None,
+        "min": _short(stats["min"]),
+        "p25": _short(stats["25%"]),
+        "median": _short(stats["50%"]),
+        "p75": _short(stats["75%"]),
+        "max": _short(stats["max"]),
+    }
+
+
+def _categorical_stats(series, weights=None):
+    if weights is not None:
+        totals = weights.groupby(series, sort=False).sum().sort_values(ascending=False)
+    else:
+        totals = series.value_counts()
+    top = totals.head(PROFILE_TOP_K)
+    stats = {
+        "type": "categorical",
+        "distinct": int(series.nunique()),
+        "top": [{"value": _short(value), "total" if weights is not None else "count": _short(total)} for value, total in top.items()],
+    }
+    if len(totals) > len(top):
+        stats["other_total" if weights is not None else "other_count"] = _short(totals.iloc[len(top):].sum())
+    if weights is not None:
+        stats["weighted_by"] = weights.name
+    return stats
+
+
+def _is_date_column(series):
+    # DATE results arrive as datetime.date objects in an object column.
+    values = series.dropna()
+    return series.dtype == object and not values.empty and all(isinstance(value, dt.date) for value in values.head(PROFILE_SAMPLE_ROWS))
+
+
+def _time_buckets(series, weights=None):
+    series = series.dt.tz_localize(None) if getattr(series.dt, "tz", None) is not None else series
+    span = series.max() - series.min()
+    for freq, label in _BUCKETS:
+        periods = series.dt.to_period(freq)
+        if periods.nunique() <= PROFILE_MAX_TIME_BUCKETS or freq == "Y":
+            break
+    if weights is not None:
+        grouped = weights.groupby(periods).sum()
+    else:
+        grouped = periods.value_counts().sort_index()
+    return {
+        "type": "datetime",
+        "min": _short(series.min()),
+        "max": _short(series.max()),
+        "span_days": _short(span / pd.Timedelta(days=1)),
+        "bucket": label,
+        "buckets": [{"period": str(period), "total" if weights is not None else "count": _short(value)} for period, value in grouped.tail(PROFILE_MAX_TIME_BUCKETS).items()],
+        **({"weighted_by": weights.name} if weights is not None else {}),
+    }
+
+
+def _correlations(numeric):
+    if numeric.shape[1] < 2:
+        return []
+    corr = numeric.corr().to_numpy()
+    upper = np.triu_indices_from(corr, k=1)
+    values = corr[upper]
+    order = np.argsort(-np.abs(np.nan_to_num(values)))[:PROFILE_MAX_CORRELATIONS]
+    columns = numeric.columns
+    return [
+        {"a": columns[upper[0][i]], "b": columns[upper[1][i]], "pearson": _short(values[i])}
+        for i in order if not np.isnan(values[i])
+    ]
+
+
+def profile_result(df, sql_query=None):
+    """Summarizes every row of `df` into a bounded dict for the insight prompt.
+
+    Numeric columns get descriptive statistics, categorical columns their
+    top-k values, datetime and date columns bucketed counts, plus the
+    strongest numeric correlations and a few sample rows. When the result
+    has exactly one numeric measure and `sql_query` shows it is a COUNT or
+    SUM, categorical and time breakdowns are totals of that measure (e.g.
+    request counts) rather than row counts; averages, coordinates and other
+    non-additive values are never summed.
+    """
+    columns = list(df.columns[:PROFILE_MAX_COLUMNS])
+    df = sample = df[columns]
+    dates = [column for column in columns if _is_date_column(df[column])]
+    if dates:
+        df = df.assign(**{column: pd.to_datetime(df[column]) for column in dates})
+    numeric = df.select_dtypes(include="number")
+    datetimes = df.select_dtypes(include=["datetime", "datetimetz"])
+    measure = None
+    if numeric.shape[1] == 1 and numeric.columns[0] in additive_columns(sql_query):
+        measure = numeric.iloc[:, 0]
+
+    column_stats = {}
+    for column in columns:
+        series = df[column]
+        if column in numeric.columns:
+            column_stats[column] = _numeric_stats(series)
+        elif column in datetimes.columns:
+            column_stats[column] = _time_buckets(series, measure)
+        else:
+            column_stats[column] = _categorical_stats(series.astype(str), measure)
+
+    return {
+        "row_count": int(len(df)),
+        "column_count": int(len(columns)),
+        "columns": column_stats,
+        "correlations": _correlations(numeric),
+        "sample_rows": [
+            {key: _short(value) for key, value in row.items()}
+            for row in sample.head(PROFILE_SAMPLE_ROWS).to_dict(orient="records")
+        ],
+    }
+
+
+def profile_result_json(df, sql_query=None):
+    return json.dumps(profile_result(df, sql_query), default=str)
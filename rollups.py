@@ -0,0 +1,409 @@
+"""Pre-aggregated request counts and the rewriter that answers queries from them.
+
+    python rollups.py build              # build the rollups from the local snapshot
+    python rollups.py build --bigquery   # (re)create them in ROLLUP_DATASET
+    python rollups.py rewrite "SELECT ..."
+
+Each rollup holds COUNT(*) as `request_count` per combination of a few
+dimensions and `created_at` truncated to a day or a month. `created_at` keeps
+its name, so a query only has to change its table and its COUNTs.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+
+import pyarrow.parquet as pq
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+import local_engine
+from call_limits import limited_call
+from local_engine import TABLE_ID, register_local_table, run_local_query, get_snapshot_metadata
+
+# BigQuery dataset ("project.dataset") holding the rollup tables; unset disables BigQuery rollups.
+ROLLUP_DATASET = os.environ.get("ROLLUP_DATASET", "")
+# BigQuery rollups older than this are not used; rebuild them on a schedule.
+ROLLUP_MAX_AGE_SECONDS = float(os.environ.get("ROLLUP_MAX_AGE_SECONDS", 24 * 3600))
+# How long the list of BigQuery rollup tables is trusted.
+ROLLUP_TABLES_TTL_SECONDS = float(os.environ.get("ROLLUP_TABLES_TTL_SECONDS", 600))
+USE_ROLLUPS = os.environ.get("USE_ROLLUPS", "1") == "1"
+
+TIME_COLUMN = "created_at"
+COUNT_COLUMN = "request_count"
+
+# (name, dimensions, grain), smallest first; the rewriter uses the first one that fits.
+ROLLUPS = [
+    ("rollup_day", [], "day"),
+    ("rollup_source_day", ["source"], "day"),
+    ("rollup_agency_day", ["agency_responsible"], "day"),
+    ("rollup_neighborhood_day", ["neighborhood"], "day"),
+    ("rollup_subtype_day", ["service_name", "service_subtype"], "day"),
+    ("rollup_neighborhood_subtype_month", ["neighborhood", "service_name", "service_subtype"], "month"),
+    ("rollup_all_month", ["neighborhood", "service_name", "service_subtype", "agency_responsible", "source", "status"], "month"),
+]
+
+# Coarseness of a time grain; a rollup at grain g answers anything that needs grain g or coarser.
+_GRAIN_RANK = {"day": 0, "month": 1, "year": 2}
+_PART_GRAINS = {
+    "YEAR": "year",
+    "QUARTER": "month",
+    "MONTH": "month",
+    "WEEK": "day",
+    "ISOWEEK": "day",
+    "ISOYEAR": "day",
+    "DAY": "day",
+    "DAYOFWEEK": "day",
+    "DAYOFYEAR": "day",
+    "DATE": "day",
+}
+# FORMAT_TIMESTAMP directives by the grain they need; anything else (hours, minutes...) is too fine.
+_FORMAT_GRAINS = {
+    "Y": "year", "y": "year", "C": "year",
+    "m": "month", "b": "month", "B": "month", "h": "month", "Q": "month",
+    "d": "day", "e": "day", "j": "day", "a": "day", "A": "day", "u": "day", "w": "day",
+    "U": "day", "W": "day", "V": "day", "G": "day", "g": "day", "F": "day", "D": "day", "x": "day",
+    "%": "year",
+}
+_DATE_LITERAL = re.compile(r"^(\d{4})-(\d{2})-(\d{2})(?:[ T]00:00:00(?:\.0+)?)?(?: ?(?:UTC|Z|\+00(?::?00)?))?$")
+
+_lock = threading.Lock()
+_bigquery_tables = {"checked_at": 0.0, "modified": {}}
+_stats = {"rewritten": 0, "not_rewritable": 0}
+
+
+def rollup_dir():
+    return os.path.join(local_engine.SNAPSHOT_DIR, "rollups")
+
+
+def _metadata_path():
+    return os.path.join(rollup_dir(), "rollups.json")
+
+
+def rollup_table_id(name):
+    return f"{ROLLUP_DATASET or 'local_rollups'}.{name}"
+
+
+def _register_local_rollups():
+    for name, _, _ in ROLLUPS:
+        register_local_table(rollup_table_id(name), name, os.path.join(rollup_dir(), f"{name}.parquet"))
+
+
+_register_local_rollups()
+
+
+def rollup_select_sql(dimensions, grain):
+    """The BigQuery SQL that computes one rollup from the base table."""
+    unit = grain.upper()
+    columns = ", ".join([f"TIMESTAMP_TRUNC({TIME_COLUMN}, {unit}) AS {TIME_COLUMN}"] + dimensions)
+    group_by = ", ".join(str(i + 1) for i in range(len(dimensions) + 1))
+    return f"SELECT {columns}, COUNT(*) AS {COUNT_COLUMN} FROM `{TABLE_ID}` GROUP BY {group_by}"
+
+
+def _buildable(dimensions, available_columns):
+    missing = [column for column in [TIME_COLUMN] + dimensions if column not in available_columns]
+    if missing:
+        print(f"Skipping rollup over {dimensions}: the table has no {', '.join(missing)}")
+    return not missing
+
+
+def build_local_rollups():
+    """Builds every rollup from the local snapshot; returns {name: rows}."""
+    metadata = get_snapshot_metadata()
+    if metadata is None:
+        raise RuntimeError("No local snapshot; run `python local_engine.py sync` or `synthetic` first.")
+    os.makedirs(rollup_dir(), exist_ok=True)
+    available_columns = set(pq.read_schema(local_engine.snapshot_path()).names)
+    built = {}
+    for name, dimensions, grain in ROLLUPS:
+        if not _buildable(dimensions, available_columns):
+            continue
+        table = run_local_query(rollup_select_sql(dimensions, grain))
+        pq.write_table(table, os.path.join(rollup_dir(), f"{name}.parquet"), compression="zstd")
+        built[name] = table.num_rows
+    with open(_metadata_path(), "w") as f:
+        json.dump({"snapshot_synced_at": metadata["synced_at"], "built_at": time.time(), "rows": built}, f, indent=2)
+    local_engine.reset_connection()
+    return built
+
+
+def build_bigquery_rollups():
+    """Creates or replaces every rollup table in ROLLUP_DATASET; returns the names built."""
+    from bigquery_client import get_bigquery_client
+
+    if not ROLLUP_DATASET:
+        raise RuntimeError("Set ROLLUP_DATASET to the BigQuery dataset that should hold the rollups.")
+    client = get_bigquery_client(ROLLUP_DATASET.split(".")[0])
+    available_columns = {field.name for field in client.get_table(TABLE_ID).schema}
+    built = []
+    for name, dimensions, grain in ROLLUPS:
+        if not _buildable(dimensions, available_columns):
+            continue
+        build_sql = f"CREATE OR REPLACE TABLE `{rollup_table_id(name)}` AS {rollup_select_sql(dimensions, grain)}"
+        limited_call("bigquery", client.project, lambda: client.query(build_sql).result())
+        built.append(name)
+    with _lock:
+        _bigquery_tables["checked_at"] = 0.0
+    return built
+
+
+def _local_rollups():
+    if not os.path.exists(_metadata_path()):
+        return set()
+    with open(_metadata_path()) as f:
+        metadata = json.load(f)
+    # Rollups built from an older snapshot would disagree with the snapshot itself.
+    if metadata["snapshot_synced_at"] != (get_snapshot_metadata() or {}).get("synced_at"):
+        return set()
+    return set(metadata["rows"])
+
+
+def _bigquery_rollups():
+    if not ROLLUP_DATASET:
+        return set()
+    with _lock:
+        if time.monotonic() - _bigquery_tables["checked_at"] >= ROLLUP_TABLES_TTL_SECONDS:
+            modified = {}
+            try:
+                from bigquery_client import get_bigquery_client
+
+                client = get_bigquery_client(ROLLUP_DATASET.split(".")[0])
+                for name, _, _ in ROLLUPS:
+                    try:
+                        modified[name] = client.get_table(rollup_table_id(name)).modified.timestamp()
+                    except Exception:
+                        pass
+            except Exception as e:
+                print(f"Could not list rollup tables: {e}")
+            _bigquery_tables["modified"] = modified
+            _bigquery_tables["checked_at"] = time.monotonic()
+        now = time.time()
+        return {name for name, modified in _bigquery_tables["modified"].items() if now - modified < ROLLUP_MAX_AGE_SECONDS}
+
+
+def available_rollups(engine):
+    return _local_rollups() if engine == "local" else _bigquery_rollups()
+
+
+def _finer(a, b):
+    if a is None or b is None:
+        return None
+    return a if _GRAIN_RANK[a] <= _GRAIN_RANK[b] else b
+
+
+def _unit_name(unit):
+    if isinstance(unit, exp.WeekStart):
+        return "WEEK"
+    return unit.name.upper() if unit is not None else ""
+
+
+def _truncation_grain(node):
+    """Grain that `node` truncates its timestamp argument to, or None if it is not a day-or-coarser truncation."""
+    if node.args.get("zone"):
+        return None
+    if isinstance(node, exp.Extract):
+        return _PART_GRAINS.get(_unit_name(node.this))
+    if isinstance(node, (exp.Date, exp.TsOrDsToDate)):
+        return "day"
+    if isinstance(node, exp.Cast) and node.to.is_type(exp.DataType.Type.DATE):
+        return "day"
+    if isinstance(node, (exp.DateTrunc, exp.TimestampTrunc)):
+        return _PART_GRAINS.get(_unit_name(node.args.get("unit")))
+    if isinstance(node, exp.TimeToStr) and isinstance(node.args.get("format"), exp.Literal):
+        grains = [_FORMAT_GRAINS.get(directive) for directive in re.findall(r"%[EO#-]?(.)", node.args["format"].this)]
+        if None in grains:
+            return None
+        return min(grains, key=_GRAIN_RANK.get, default="year")
+    return None
+
+
+def _aligned_grain(node):
+    """Coarsest grain whose boundaries `node` (a column-free time value) always falls on, or None."""
+    if node.find(exp.Column):
+        return None
+    if isinstance(node, exp.Literal) and node.is_string:
+        match = _DATE_LITERAL.match(node.this)
+        if not match:
+            return None
+        if match.group(3) != "01":
+            return "day"
+        return "year" if match.group(2) == "01" else "month"
+    if isinstance(node, exp.CurrentDate):
+        return "day"
+    if isinstance(node, (exp.Cast, exp.Timestamp, exp.Date, exp.TsOrDsToDate, exp.TsOrDsToTimestamp)):
+        if node.args.get("zone"):
+            return None
+        return _aligned_grain(node.this)
+    if isinstance(node, (exp.DateSub, exp.DateAdd, exp.TimestampSub, exp.TimestampAdd)):
+        return _finer(_aligned_grain(node.this), _PART_GRAINS.get(_unit_name(node.args.get("unit"))))
+    if isinstance(node, (exp.DateTrunc, exp.TimestampTrunc)):
+        return _truncation_grain(node)
+    return None
+
+
+def _time_use_grain(column):
+    """Finest grain a use of the raw time column needs, or None if no rollup can answer it."""
+    node = column
+    parent = node.parent
+    while isinstance(parent, exp.TsOrDsToTimestamp):
+        node, parent = parent, parent.parent
+    grain = _truncation_grain(parent)
+    if grain is not None:
+        return grain
+    # Half-open range filters on the raw timestamp work when the bound is aligned to the grain.
+    lower_or_upper = {exp.GTE: "this", exp.LT: "this", exp.LTE: "expression", exp.GT: "expression"}
+    side = lower_or_upper.get(type(parent))
+    if side is not None and parent.args.get(side) is node:
+        other = parent.expression if side == "this" else parent.this
+        return _aligned_grain(other)
+    return None
+
+
+def _count_replacement(count, dimensions):
+    argument = count.this
+    # Distinct values are the same on the rollup; its rows only exist for combinations that occur.
+    if isinstance(argument, exp.Distinct):
+        return count
+    if isinstance(argument, exp.Star) or (isinstance(argument, exp.Literal) and not argument.is_string):
+        return sqlglot.parse_one(f"CAST(COALESCE(SUM({COUNT_COLUMN}), 0) AS INT64)", read="bigquery")
+    if isinstance(argument, exp.Column) and argument.name in dimensions:
+        return sqlglot.parse_one(
+            f"CAST(COALESCE(SUM(IF({argument.sql(dialect='bigquery')} IS NOT NULL, {COUNT_COLUMN}, 0)), 0) AS INT64)",
+            read="bigquery",
+        )
+    return None
+
+
+def _in_alias_clause(column, select):
+    # Only GROUP BY, ORDER BY and HAVING see SELECT aliases; elsewhere the name is a table column.
+    clause = column.find_ancestor(exp.Group, exp.Order, exp.Having)
+    return clause is not None and clause.parent is select
+
+
+def _requirements(select):
+    """(dimensions used, finest time grain needed) for a query a rollup might answer, or None."""
+    if not isinstance(select, exp.Select) or select.args.get("joins") or select.args.get("with"):
+        return None
+    if any(node is not select for node in select.find_all(exp.Select)) or select.find(exp.Unnest):
+        return None
+    # SELECT * would expose the rollup's columns; only COUNT(*) is allowed.
+    if any(not isinstance(star.parent, exp.Count) for star in select.find_all(exp.Star)):
+        return None
+    from_ = select.find(exp.From)
+    if from_ is None or not isinstance(from_.this, exp.Table):
+        return None
+    table = from_.this
+    if ".".join(part for part in (table.catalog, table.db, table.name) if part) != TABLE_ID:
+        return None
+    aggregates = list(select.find_all(exp.AggFunc))
+    if not any(isinstance(aggregate, exp.Count) for aggregate in aggregates):
+        return None
+
+    aliases = {expression.alias for expression in select.expressions if expression.alias}
+    dimensions = set()
+    grain = "year"
+    for column in select.find_all(exp.Column):
+        if column.table and column.table not in (table.alias_or_name, table.name):
+            return None
+        if column.name == TIME_COLUMN:
+            grain = _finer(grain, _time_use_grain(column))
+            if grain is None:
+                return None
+        elif not column.table and column.name in aliases and _in_alias_clause(column, select):
+            continue
+        else:
+            dimensions.add(column.name)
+
+    for aggregate in aggregates:
+        if isinstance(aggregate, exp.Count):
+            continue
+        # MIN/MAX of a dimension or of a truncated time are the same on the rollup;
+        # other aggregates are only fine as windows over the rewritten counts (SUM(COUNT(*)) OVER ()).
+        if isinstance(aggregate, (exp.Min, exp.Max)) or (aggregate.find(exp.Count) and aggregate.find_ancestor(exp.Window)):
+            continue
+        return None
+    return dimensions, grain
+
+
+def rewrite_for_rollups(sql_query, engine="bigquery"):
+    """Returns `sql_query` redirected to the smallest rollup that answers it exactly, or unchanged.
+
+    Only single-table COUNT queries over rollup dimensions qualify, and every
+    use of `created_at` has to depend on its day (or month) alone: EXTRACT,
+    DATE(), truncation, date-only FORMAT_TIMESTAMP, or half-open range filters
+    on aligned bounds.
+    """
+    if not USE_ROLLUPS or not sql_query:
+        return sql_query
+    try:
+        tree = sqlglot.parse_one(sql_query, read="bigquery")
+    except SqlglotError:
+        return sql_query
+    requirements = _requirements(tree)
+    if requirements is None:
+        _record(False)
+        return sql_query
+    dimensions, grain = requirements
+    available = available_rollups(engine)
+    for name, rollup_dimensions, rollup_grain in ROLLUPS:
+        if name not in available or not dimensions <= set(rollup_dimensions):
+            continue
+        if _GRAIN_RANK[rollup_grain] > _GRAIN_RANK[grain]:
+            continue
+        rewritten = tree.copy()
+        for count in list(rewritten.find_all(exp.Count)):
+            replacement = _count_replacement(count, rollup_dimensions)
+            if replacement is None:
+                break
+            if replacement is not count:
+                count.replace(replacement)
+        else:
+            table = rewritten.find(exp.From).this
+            parts = rollup_table_id(name).split(".")
+            table.set("catalog", exp.to_identifier(parts[0]) if len(parts) == 3 else None)
+            table.set("db", exp.to_identifier(parts[-2]))
+            table.set("this", exp.to_identifier(parts[-1]))
+            _record(True)
+            return rewritten.sql(dialect="bigquery")
+        break
+    _record(False)
+    return sql_query
+
+
+def _record(rewritten):
+    with _lock:
+        _stats["rewritten" if rewritten else "not_rewritable"] += 1
+
+
+def get_rollup_stats():
+    with _lock:
+        rewritten = _stats["rewritten"]
+        skipped = _stats["not_rewritable"]
+    total = rewritten + skipped
+    return {"rewritten": rewritten, "not_rewritable": skipped, "hit_rate": rewritten / total if total else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="build the rollups")
+    build_parser.add_argument("--bigquery", action="store_true", help="create the tables in ROLLUP_DATASET")
+    rewrite_parser = commands.add_parser("rewrite", help="show how a query would be rewritten")
+    rewrite_parser.add_argument("sql")
+    rewrite_parser.add_argument("--engine", choices=["bigquery", "local"], default="local")
+    args = parser.parse_args()
+
+    if args.command == "build" and args.bigquery:
+        print(f"Built {', '.join(build_bigquery_rollups())} in {ROLLUP_DATASET}")
+    elif args.command == "build":
+        for name, rows in build_local_rollups().items():
+            print(f"{name}: {rows} rows")
+    else:
+        print(rewrite_for_rollups(args.sql, args.engine))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+import time
+
+from bigquery_client import get_bigquery_client
+from call_limits import limited_call
+from local_engine import get_snapshot_metadata, snapshot_schema_text, snapshot_sample_rows
+
+project_id = "bigquery-public-data"
+dataset_id = "san_francisco_311"
+table_name = "311_service_requests"
+
+# How long the cached table metadata is trusted before we ask BigQuery
+# whether the table's `modified` timestamp has moved.
+SCHEMA_CACHE_TTL_SECONDS = float(os.environ.get("SCHEMA_CACHE_TTL_SECONDS", 3600))
+SAMPLE_ROW_LIMIT = 10
+
+_lock = threading.Lock()
+_catalog = {
+    "checked_at": 0.0,
+    "modified": None,
+    "schema_text": None,
+    "sample_rows": None,
+}
+
+
+def _table_ref():
+    return f"{project_id}.{dataset_id}.{table_name}"
+
+
+def _build_schema_text(table):
+    schema_text = f"Table: {table.table_id}\n"
+    for column in table.schema:
+        schema_text += f"    - {column.name} ({column.field_type})\n"
+    return schema_text
+
+
+def _fetch_sample_rows(limit=SAMPLE_ROW_LIMIT):
+    bq_client = get_bigquery_client(project_id)
+    query = f"SELECT * FROM `{_table_ref()}` LIMIT {limit}"
+    rows = limited_call("bigquery", project_id, lambda: bq_client.query(query).result())
+    return json.dumps([dict(row) for row in rows], indent=2, default=str)
+
+
+def _refresh_if_stale():
+    """Revalidates the cached schema against the table's `modified` timestamp.
+
+    Within the TTL no BigQuery calls are made. After it expires a single
+    metadata call is made; when the table has changed, the sample rows are
+    dropped and re-queried on the next `get_sample_rows()`.
+    """
+    now = time.monotonic()
+    if _catalog["schema_text"] is not None and now - _catalog["checked_at"] < SCHEMA_CACHE_TTL_SECONDS:
+        return
+
+    try:
+        bq_client = get_bigquery_client(project_id)
+        table = limited_call("bigquery", project_id, bq_client.get_table, _table_ref())
+    except Exception as e:
+        # Offline: describe the table from the local snapshot when there is one.
+        if get_snapshot_metadata() is None:
+            raise
+        print(f"Reading the schema from the local snapshot; BigQuery metadata failed: {e}")
+        _catalog["schema_text"] = snapshot_schema_text()
+        _catalog["sample_rows"] = snapshot_sample_rows(SAMPLE_ROW_LIMIT)
+        _catalog["modified"] = None
+        _catalog["checked_at"] = now
+        return
+    if table.modified != _catalog["modified"] or _catalog["schema_text"] is None:
+        _catalog["schema_text"] = _build_schema_text(table)
+        _catalog["sample_rows"] = None
+        _catalog["modified"] = table.modified
+    _catalog["checked_at"] = now
+
+
+def get_schema_text():
+    with _lock:
+        _refresh_if_stale()
+        return _catalog["schema_text"]
+
+
+def get_sample_rows():
+    # A billed query, so it only runs when sample rows are asked for, once per table version.
+    with _lock:
+        _refresh_if_stale()
+        if _catalog["sample_rows"] is None:
+            _catalog["sample_rows"] = _fetch_sample_rows()
+        return _catalog["sample_rows"]
+
+
+def invalidate():
+    with _lock:
+        _catalog["checked_at"] = 0.0
+        _catalog["modified"] = None
+        _catalog["schema_text"] = None
+        _catalog["sample_rows"] = None
@@ -0,0 +1,71 @@
+"""Process-wide deduplication of identical in-flight work.
+
+When several sessions ask for the same thing at once (a shared dashboard
+link), the first caller for a key runs the computation and every concurrent
+caller with the same key waits for it and gets the same result or
+exception, instead of repeating the model calls or the BigQuery job. Only
+outcomes of the computation itself are shared: when the leader is
+interrupted (a Streamlit rerun or stop, KeyboardInterrupt), the waiting
+callers retry and one of them leads instead. Keys are only held while the
+computation runs; finished results are left to the SQL and result caches.
+"""
+import threading
+
+_lock = threading.Lock()
+_in_flight = {}
+_stats = {"leaders": 0, "followers": 0}
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Set when the leader was interrupted; its followers retry.
+        self.abandoned = False
+        self.followers = 0
+
+
+def do(namespace, key, func, *args, **kwargs):
+    """Returns (result, shared): `func(*args, **kwargs)` run once per in-flight (`namespace`, `key`).
+
+    `shared` is True when the result came from another caller's computation.
+    """
+    flight_key = (namespace, key)
+    while True:
+        with _lock:
+            flight = _in_flight.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = _in_flight[flight_key] = _Flight()
+                _stats["leaders"] += 1
+            else:
+                flight.followers += 1
+                _stats["followers"] += 1
+        if leader:
+            break
+        flight.done.wait()
+        if flight.abandoned:
+            continue
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, True
+    try:
+        flight.result = func(*args, **kwargs)
+        return flight.result, False
+    except Exception as e:
+        flight.error = e
+        raise
+    except BaseException:
+        flight.abandoned = True
+        raise
+    finally:
+        with _lock:
+            del _in_flight[flight_key]
+        flight.done.set()
+
+
+def get_single_flight_stats():
+    """Computations run (leaders), callers that shared one (followers) and keys currently in flight."""
+    with _lock:
+        return dict(_stats, in_flight=len(_in_flight))
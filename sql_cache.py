@@ -0,0 +1,136 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+SQL_CACHE_PATH = os.environ.get("SQL_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sql_cache.sqlite3"))
+SQL_CACHE_TTL_SECONDS = float(os.environ.get("SQL_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+SQL_CACHE_MAX_ENTRIES = int(os.environ.get("SQL_CACHE_MAX_ENTRIES", 5000))
+
+_lock = threading.Lock()
+_connection = None
+
+
+def normalize_question(question: str) -> str:
+    """Lower-cases the question, collapses whitespace and drops trailing punctuation."""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?.!")
+
+
+def schema_fingerprint(schema_text: str) -> str:
+    return hashlib.sha256(schema_text.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(question: str, schema_text: str) -> str:
+    raw = f"{schema_fingerprint(schema_text)}:{normalize_question(question)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _connect():
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(SQL_CACHE_PATH, check_same_thread=False)
+        _connection.execute(
+            """CREATE TABLE IF NOT EXISTS sql_cache (
+                key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                simplified_question TEXT,
+                generated_sql TEXT,
+                verified_sql TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        _connection.execute(
+            """CREATE TABLE IF NOT EXISTS sql_cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )"""
+        )
+        _connection.commit()
+    return _connection
+
+
+def _bump_stat(conn, name):
+    conn.execute(
+        "INSERT INTO sql_cache_stats (name, value) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+        (name,),
+    )
+
+
+def get_cached_sql(question: str, schema_text: str):
+    """Returns the cached entry for the question as a dict, or None on a miss."""
+    key = cache_key(question, schema_text)
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        row = conn.execute(
+            "SELECT simplified_question, generated_sql, verified_sql, created_at "
+            "FROM sql_cache WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None or now - row[3] > SQL_CACHE_TTL_SECONDS:
+            if row is not None:
+                conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+            _bump_stat(conn, "misses")
+            conn.commit()
+            return None
+        conn.execute(
+            "UPDATE sql_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?",
+            (now, key),
+        )
+        _bump_stat(conn, "hits")
+        conn.commit()
+    return {
+        "simplified_question": row[0],
+        "generated_sql": row[1],
+        "verified_sql": row[2],
+        "age_seconds": now - row[3],
+    }
+
+
+def put_cached_sql(question: str, schema_text: str, simplified_question: str, generated_sql: str, verified_sql: str):
+    if not verified_sql:
+        return
+    key = cache_key(question, schema_text)
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO sql_cache "
+            "(key, question, simplified_question, generated_sql, verified_sql, created_at, last_used_at, hits) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+            (key, normalize_question(question), simplified_question, generated_sql, verified_sql, now, now),
+        )
+        _evict(conn, now)
+        conn.commit()
+
+
+def _evict(conn, now):
+    # Expired entries go first, then the least recently used beyond the cap.
+    conn.execute("DELETE FROM sql_cache WHERE created_at < ?", (now - SQL_CACHE_TTL_SECONDS,))
+    conn.execute(
+        "DELETE FROM sql_cache WHERE key IN ("
+        "SELECT key FROM sql_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+        (SQL_CACHE_MAX_ENTRIES,),
+    )
+
+
+def get_cache_stats():
+    with _lock:
+        conn = _connect()
+        stats = dict(conn.execute("SELECT name, value FROM sql_cache_stats").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+    return {"hits": stats.get("hits", 0), "misses": stats.get("misses", 0), "entries": entries}
+
+
+def clear_cache():
+    with _lock:
+        conn = _connect()
+        conn.execute("DELETE FROM sql_cache")
+        conn.execute("DELETE FROM sql_cache_stats")
+        conn.commit()
@@ -1,7 +1,11 @@
-from google.cloud import bigquery
-from google import genai
-from google.genai import types
+import functools
+from bigquery_client import get_bigquery_client
+from call_limits import limited_call
 import json
+import schema_catalog
+from model_client import get_model_client
+from prompts import register_prompt, generate
+from tracing import traced
 
 # Set the public dataset details
 project_id = "bigquery-public-data"
@@ -10,31 +14,23 @@ table_name = "311_service_requests"
 
 model = "gemini-2.0-flash-001" 
 
-client = genai.Client(project=project_id, location="global", vertexai=True)
+client = None
 
 
 def get_bigquery_table_schema_text():
-    bq_client = bigquery.Client(project=project_id)
-    table_ref = f"{project_id}.{dataset_id}.{table_name}"
-    table = bq_client.get_table(table_ref)
-    schema_text = f"Table: {table.table_id}\n"
-    for column in table.schema:
-        schema_text += f"    - {column.name} ({column.field_type})\n"
-    return schema_text
-
-def get_sample_rows(limit=10):
-    bq_client = bigquery.Client(project=project_id)
+    return schema_catalog.get_schema_text()
+
+def get_sample_rows(limit=schema_catalog.SAMPLE_ROW_LIMIT):
+    if limit == schema_catalog.SAMPLE_ROW_LIMIT:
+        return schema_catalog.get_sample_rows()
+    bq_client = get_bigquery_client(project_id)
     query = f"SELECT * FROM `{project_id}.{dataset_id}.{table_name}` LIMIT {limit}"
-    rows = bq_client.query(query).result()
+    rows = limited_call("bigquery", project_id, lambda: bq_client.query(query).result())
     return json.dumps([dict(row) for row in rows], indent=2, default=str)
 
 
 
-def generate_sql(question: str):
-    schema = get_bigquery_table_schema_text()
-    sample_rows = get_sample_rows()
-
-    instruction =  f"""You are a BigQuery SQL generator.
+GENERATE_PROMPT = register_prompt("generate", """You are a BigQuery SQL generator.
 
 Your task is to convert natural language questions into valid BigQuery SQL queries using the dataset:
 `bigquery-public-data.san_francisco_311.311_service_requests`
@@ -79,10 +75,13 @@ WHERE EXTRACT(YEAR FROM created_at) = EXTRACT(YEAR FROM CURRENT_DATE()) - 1
 GROUP BY neighborhood
 ORDER BY pothole_requests DESC
 LIMIT 100
-"""
+""", "{question}", max_system_tokens=650)
 
- 
-    generate_content_config = types.GenerateContentConfig(
+
+@functools.lru_cache(maxsize=None)
+def generate_content_config():
+    from google.genai import types
+    return types.GenerateContentConfig(
         temperature=0.3,
         top_p=1,
         max_output_tokens=8000,
@@ -92,16 +91,11 @@ LIMIT 100
             types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="OFF"),
             types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="OFF"),
         ],
-        system_instruction=[types.Part.from_text(text=instruction)],
     )
 
-    contents = [
-        types.Content(
-            role="user",
-            parts=[types.Part.from_text(text=question)]
-        )
-    ]
-  
-    response = client.models.generate_content(contents=contents, config=generate_content_config, model=model)
+
+@traced("generate")
+def generate_sql(question: str):
+    response = generate(client or get_model_client(project_id), model, GENERATE_PROMPT, generate_content_config(), question=question)
     sql_query = response.text.strip()
     return sql_query.replace("```sql", "").replace("```", "").strip()
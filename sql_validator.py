@@ -0,0 +1,111 @@
+import re
+import threading
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+ALLOWED_TABLE = "bigquery-public-data.san_francisco_311.311_service_requests"
+# Clauses where BigQuery resolves names to the SELECT list's own aliases.
+ALIAS_CLAUSES = (exp.Group, exp.Having, exp.Order)
+
+_stats_lock = threading.Lock()
+_stats = {"checked": 0, "llm_skipped": 0}
+
+
+def parse_schema_columns(schema_text: str) -> dict:
+    """Maps lower-cased column names to their types from `get_bigquery_table_schema_text()` output."""
+    columns = {}
+    for match in re.finditer(r"^\s*-\s*(\w+)\s*\((\w+)\)", schema_text, flags=re.MULTILINE):
+        columns[match.group(1).lower()] = match.group(2)
+    return columns
+
+
+def _table_id(table):
+    return ".".join(part for part in (table.catalog, table.db, table.name) if part)
+
+
+def validate_sql(sql_query: str, schema_text: str) -> dict:
+    """Statically checks `sql_query` against the table schema.
+
+    Returns {"valid": bool, "issues": [...]}. A query is only reported valid
+    when it parses as a single BigQuery SELECT, reads from nothing but the
+    allowed table (or its own CTEs), and every column reference resolves to a
+    schema column, an output column of a CTE or subquery, or (in GROUP BY,
+    HAVING and ORDER BY only) an alias of its own SELECT list. Anything else
+    is left to the LLM verifier.
+    """
+    issues = []
+    columns = parse_schema_columns(schema_text)
+    if not columns:
+        return {"valid": False, "issues": ["schema has no columns to check against"]}
+
+    try:
+        statements = [statement for statement in sqlglot.parse(sql_query, read="bigquery") if statement is not None]
+    except ParseError as e:
+        return {"valid": False, "issues": [f"parse error: {e}"]}
+    if len(statements) != 1:
+        return {"valid": False, "issues": [f"expected one statement, found {len(statements)}"]}
+    tree = statements[0]
+    if not isinstance(tree, exp.Query):
+        return {"valid": False, "issues": [f"only SELECT queries are allowed, got {tree.key.upper()}"]}
+
+    cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    table_aliases = set(cte_names)
+    for table in tree.find_all(exp.Table):
+        if not table.db and table.name.lower() in cte_names:
+            table_aliases.add(table.alias_or_name.lower())
+            continue
+        if _table_id(table) != ALLOWED_TABLE:
+            issues.append(f"table not allowed: {_table_id(table)}")
+        table_aliases.add(table.name.lower())
+        table_aliases.add(table.alias_or_name.lower())
+    for subquery in tree.find_all(exp.Subquery):
+        if subquery.alias:
+            table_aliases.add(subquery.alias.lower())
+
+    select_aliases = {
+        id(select): {alias.alias.lower() for alias in select.expressions if isinstance(alias, exp.Alias) and alias.alias}
+        for select in tree.find_all(exp.Select)
+    }
+    cte_columns = set()
+    for cte in tree.find_all(exp.CTE):
+        cte_alias = cte.args.get("alias")
+        if cte_alias is not None:
+            cte_columns.update(column.name.lower() for column in cte_alias.columns)
+
+    for column in tree.find_all(exp.Column):
+        name = column.name.lower()
+        if column.table and column.table.lower() not in table_aliases:
+            issues.append(f"unknown table reference: {column.table}.{column.name}")
+            continue
+        if name in columns or name in cte_columns:
+            continue
+        select = column.find_ancestor(exp.Select)
+        own_aliases = select_aliases.get(id(select), set())
+        # Aliases of other SELECTs are the output columns of CTEs and subqueries.
+        if any(name in aliases for key, aliases in select_aliases.items() if key != id(select)):
+            continue
+        clause = column.find_ancestor(*ALIAS_CLAUSES)
+        if name in own_aliases and clause is not None and clause.parent is select:
+            continue
+        if name in own_aliases:
+            issues.append(f"alias used outside GROUP BY, HAVING or ORDER BY: {column.name}")
+        else:
+            issues.append(f"unknown column: {column.name}")
+
+    return {"valid": not issues, "issues": issues}
+
+
+def record_validation(llm_skipped: bool):
+    with _stats_lock:
+        _stats["checked"] += 1
+        if llm_skipped:
+            _stats["llm_skipped"] += 1
+
+
+def get_validation_stats():
+    with _stats_lock:
+        checked = _stats["checked"]
+        skipped = _stats["llm_skipped"]
+    return {"checked": checked, "llm_skipped": skipped, "skip_rate": skipped / checked if checked else 0.0}
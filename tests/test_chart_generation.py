@@ -0,0 +1,45 @@
+import pandas as pd
+import pyarrow as pa
+
+from chart_generation import generate_chart
+from chart_recommender import recommend_chart
+from query_execution import QueryResult
+
+
+def _monthly_counts_by_source():
+    # SELECT TIMESTAMP_TRUNC(created_at, MONTH) AS month, source, COUNT(*) AS n ... GROUP BY 1, 2
+    months = pd.date_range("2023-01-01", periods=4, freq="MS", tz="UTC")
+    sources = ["Phone", "Web", "Mobile/Open311"]
+    table = pa.table({
+        "month": [month for month in months for _ in sources],
+        "source": [source for _ in months for source in sources],
+        "n": list(range(len(months) * len(sources))),
+    })
+    return QueryResult(table).to_pandas()
+
+
+def test_line_chart_splits_categories_into_traces():
+    df = _monthly_counts_by_source()
+    suggestion, confidence = recommend_chart(df, "monthly requests by source")
+    assert suggestion.startswith("Chart type: line")
+    assert confidence >= 0.75
+
+    fig = generate_chart(df, suggestion)
+
+    assert sorted(trace.name for trace in fig.data) == sorted(df["source"].unique())
+    for trace in fig.data:
+        assert len(trace.x) == df["month"].nunique()
+
+
+def test_stacked_doughnut_uses_string_columns():
+    df = pd.DataFrame({
+        "neighborhood": ["Mission", "Mission", "SoMa"],
+        "source": ["Phone", "Web", "Phone"],
+        "n": [3, 2, 5],
+    })
+    assert pd.api.types.is_string_dtype(df["neighborhood"])
+
+    fig = generate_chart(df, "Chart type: stacked_doughnut\nX-axis: N/A\nY-axis: N/A\nValues: n\nLabels: [neighborhood, source]")
+
+    assert fig is not None
+    assert fig.data[0].type == "sunburst"
@@ -0,0 +1,239 @@
+"""Spans and metrics for every LLM, BigQuery and charting step.
+
+Each span records wall time plus whatever the step reports about itself:
+model token counts, or the BigQuery job's bytes, slot time and cache hit.
+Finished spans go to
+
+- the spans of the current trace (`start_trace()` / `get_trace_spans()`),
+  for the per-request timing panel,
+- process-wide counters and latency histograms, exported as Prometheus
+  text by `prometheus_text()` and `start_metrics_server()`,
+- one JSON line each in TRACE_LOG_PATH, when set.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# JSONL file that receives one line per finished span; empty disables the log.
+TRACE_LOG_PATH = os.environ.get("TRACE_LOG_PATH", "")
+# Port of the Prometheus text endpoint started by the app; 0 disables it.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+HISTOGRAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Span attributes summed into Prometheus counters, by metric name.
+COUNTED_ATTRIBUTES = {
+    "prompt_tokens": "nlsql_llm_prompt_tokens_total",
+    "response_tokens": "nlsql_llm_response_tokens_total",
+    "cached_tokens": "nlsql_llm_cached_tokens_total",
+    "bytes_processed": "nlsql_bigquery_bytes_processed_total",
+    "bytes_billed": "nlsql_bigquery_bytes_billed_total",
+    "slot_ms": "nlsql_bigquery_slot_milliseconds_total",
+    "throttles": "nlsql_throttled_calls_total",
+    "retries": "nlsql_call_retries_total",
+}
+
+_trace = contextvars.ContextVar("trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_lock = threading.Lock()
+_durations = {}
+_counters = {}
+_server = None
+
+
+class Span:
+    def __init__(self, name, trace, attributes):
+        self.name = name
+        self.trace = trace
+        self.trace_id = trace["id"] if trace else None
+        self.attributes = dict(attributes)
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration_seconds = None
+        self.error = None
+
+    def end(self, error=None):
+        """Records the span; only the first call counts."""
+        if self.duration_seconds is not None:
+            return
+        self.duration_seconds = time.perf_counter() - self._started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        _finish(self)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration_seconds * 1000, 3),
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class _NoSpan:
+    def set(self, **attributes):
+        pass
+
+
+def start_trace():
+    """Starts collecting the spans of one request in the current context; returns the trace id."""
+    trace = {"id": uuid.uuid4().hex[:16], "spans": []}
+    _trace.set(trace)
+    return trace["id"]
+
+
+def get_trace_spans():
+    trace = _trace.get()
+    return [] if trace is None else list(trace["spans"])
+
+
+def current_span():
+    """The innermost open span, or a no-op stand-in outside any span."""
+    return _current_span.get() or _NoSpan()
+
+
+def start_span(name, **attributes):
+    """Opens a span in the current trace without making it current; call `end()` when done.
+
+    For work that outlives the calling frame, such as a stream consumed later.
+    """
+    return Span(name, _trace.get(), attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    current = start_span(name, **attributes)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end(error)
+
+
+def traced(name):
+    """Decorator that runs the function inside `span(name)`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm_usage(response, target=None):
+    """Adds the token counts of a genai response (or stream chunk) to `target` or the current span."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    (target or current_span()).set(
+        prompt_tokens=getattr(usage, "prompt_token_count", None) or 0,
+        response_tokens=getattr(usage, "candidates_token_count", None) or 0,
+        cached_tokens=getattr(usage, "cached_content_token_count", None) or 0,
+    )
+
+
+def record_query_job(query_job, target=None):
+    """Adds a finished BigQuery job's statistics to `target` or the current span."""
+    (target or current_span()).set(
+        job_id=getattr(query_job, "job_id", None),
+        bytes_processed=getattr(query_job, "total_bytes_processed", None) or 0,
+        bytes_billed=getattr(query_job, "total_bytes_billed", None) or 0,
+        slot_ms=getattr(query_job, "slot_millis", None) or 0,
+        cache_hit=bool(getattr(query_job, "cache_hit", False)),
+    )
+
+
+def _finish(finished):
+    if finished.trace is not None:
+        finished.trace["spans"].append(finished)
+    with _lock:
+        histogram = _durations.setdefault(finished.name, {"buckets": [0] * len(HISTOGRAM_BUCKETS), "sum": 0.0, "count": 0, "errors": 0})
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if finished.duration_seconds <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += finished.duration_seconds
+        histogram["count"] += 1
+        if finished.error:
+            histogram["errors"] += 1
+        for attribute, metric in COUNTED_ATTRIBUTES.items():
+            if finished.attributes.get(attribute):
+                key = (metric, finished.name)
+                _counters[key] = _counters.get(key, 0) + finished.attributes[attribute]
+        if finished.attributes.get("cache_hit"):
+            key = ("nlsql_bigquery_cache_hits_total", finished.name)
+            _counters[key] = _counters.get(key, 0) + 1
+        if TRACE_LOG_PATH:
+            with open(TRACE_LOG_PATH, "a") as f:
+                f.write(json.dumps(finished.to_dict(), default=str) + "\n")
+
+
+def prometheus_text():
+    """All span metrics in the Prometheus text exposition format."""
+    with _lock:
+        durations = {name: dict(histogram, buckets=list(histogram["buckets"])) for name, histogram in _durations.items()}
+        counters = dict(_counters)
+    lines = [
+        "# HELP nlsql_stage_duration_seconds Wall time of each pipeline stage.",
+        "# TYPE nlsql_stage_duration_seconds histogram",
+    ]
+    for name, histogram in sorted(durations.items()):
+        for bound, count in zip(HISTOGRAM_BUCKETS, histogram["buckets"]):
+            lines.append(f'nlsql_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+        lines.append(f'nlsql_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'nlsql_stage_duration_seconds_sum{{stage="{name}"}} {histogram["sum"]}')
+        lines.append(f'nlsql_stage_duration_seconds_count{{stage="{name}"}} {histogram["count"]}')
+    lines += ["# HELP nlsql_stage_errors_total Stage calls that raised.", "# TYPE nlsql_stage_errors_total counter"]
+    for name, histogram in sorted(durations.items()):
+        lines.append(f'nlsql_stage_errors_total{{stage="{name}"}} {histogram["errors"]}')
+    for metric in sorted({metric for metric, _ in counters}):
+        lines.append(f"# TYPE {metric} counter")
+        for (counter_metric, name), value in sorted(counters.items()):
+            if counter_metric == metric:
+                lines.append(f'{metric}{{stage="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serves `prometheus_text()` at http://0.0.0.0:<port>/metrics from a daemon thread, once per process."""
+    global _server
+    with _lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError as e:
+            print(f"Metrics endpoint not started on port {port}: {e}")
+            return None
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server